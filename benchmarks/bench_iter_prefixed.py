@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compare the offset-walking ``iter_prefixed`` against the previous,
+slicing implementation.
+
+Run from the repository root:
+``PYTHONPATH=. python benchmarks/bench_iter_prefixed.py``
+"""
+
+import os
+import random
+import struct
+import timeit
+
+from sshkeys import iter_prefixed
+
+from corpus import pack, rsa_blob
+
+
+def iter_prefixed_slicing(data):
+    # the implementation up to 0.5, kept for comparison
+    while data:
+        l = struct.unpack('!I', data[:4])[0]
+        packet, data = data[4:4 + l], data[4 + l:]
+        yield packet
+
+
+def main():
+    rnd = random.Random(0)
+    cases = [
+        ('rsa-4096', rsa_blob(rnd, 4096)),
+        ('rsa-16384', rsa_blob(rnd, 16384)),
+        ('1000-fields', pack(*[os.urandom(32) for _ in range(1000)])),
+    ]
+
+    print('{:<12} {:>14} {:>14} {:>14}'.format(
+        'blob', 'slicing', 'offsets', 'views'))
+    for name, blob in cases:
+        number = 20000 if len(blob) < 4096 else 2000
+        times = [
+            min(timeit.repeat(lambda: list(fn(blob)), number=number,
+                              repeat=3)) / number
+            for fn in (iter_prefixed_slicing,
+                       iter_prefixed,
+                       lambda b: iter_prefixed(b, copy=False))
+        ]
+        print('{:<12} {:>11.2f} us {:>11.2f} us {:>11.2f} us'.format(
+            name, *[t * 1e6 for t in times]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Measure the memory held per parsed key, using tracemalloc.
+
+Run from the repository root:
+``PYTHONPATH=. python benchmarks/bench_memory.py [-n 1000000]``
+
+With ``--max-bytes-per-key``, the script exits with a non-zero status if any
+mode exceeds the given budget, so it can be used as a regression gate.
+"""
+
+import argparse
+import gc
+import glob
+import os
+import sys
+import tracemalloc
+
+from sshkeys import Key
+
+base_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         os.pardir, 'tests')
+
+
+def measure(lines, n, lazy):
+    # every key gets its own line, decoded from bytes as when reading a
+    # file, so that the lines kept by the keys are measured as well
+    raw = [line.encode('utf-8') for line in lines]
+    gc.collect()
+    tracemalloc.start()
+    keys = []
+    append = keys.append
+    for i in range(n):
+        append(Key.from_pubkey_line(raw[i % len(raw)].decode('utf-8'), lazy))
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size / float(n)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', type=int, default=1000000,
+                        help='number of keys to create')
+    parser.add_argument('--max-bytes-per-key', type=float, default=None)
+    args = parser.parse_args()
+
+    lines = [open(fn).read().strip() for fn in
+             sorted(glob.glob(os.path.join(base_path, 'sample_*.pub')))]
+
+    failed = False
+    for lazy in (False, True):
+        per_key = measure(lines, args.n, lazy)
+        print('{:<8} {:>10.1f} bytes/key ({} keys)'.format(
+            'lazy' if lazy else 'eager', per_key, args.n))
+        if args.max_bytes_per_key and per_key > args.max_bytes_per_key:
+            failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Measure the latency of command line invocations, including interpreter
+startup.
+
+Run from the repository root:
+``PYTHONPATH=. python benchmarks/bench_startup.py [-r 20]``
+
+Every command is run ``-r`` times in a fresh interpreter and the median wall
+time is reported, together with the overhead over starting a bare
+interpreter. With ``--max-ms``, the script exits with a non-zero status if the
+overhead of any command exceeds the given budget, so it can be used as a
+regression gate.
+"""
+
+import argparse
+import getpass
+import os
+import subprocess
+import sys
+import time
+
+base_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         os.pardir, 'tests')
+sample = os.path.join(base_path, 'sample_rsa.key.pub')
+
+COMMANDS = [
+    ('help', ['--help'], None),
+    ('fingerprint', ['fingerprint', sample], None),
+    ('filter_stdin', ['filter', '-t', 'ssh-rsa', '--min-length', '2048'],
+     sample),
+    ('authorized_keys', ['authorized-keys', '-f', sample, getpass.getuser()],
+     None),
+]
+
+
+def measure(argv, stdin, repeat):
+    times = []
+    for _ in range(repeat):
+        f = open(stdin, 'rb') if stdin else subprocess.DEVNULL
+        try:
+            start = time.perf_counter()
+            subprocess.check_call(argv, stdin=f, stdout=subprocess.DEVNULL)
+            times.append(time.perf_counter() - start)
+        finally:
+            if stdin:
+                f.close()
+    times.sort()
+    return times[len(times) // 2] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-r', '--repeat', type=int, default=20)
+    parser.add_argument('--max-ms', type=float, default=None,
+                        help='maximum overhead over a bare interpreter')
+    args = parser.parse_args()
+
+    baseline = measure([sys.executable, '-c', 'pass'], None, args.repeat)
+    print('{:<16} {:>8.1f} ms'.format('interpreter', baseline))
+
+    failed = False
+    for name, cmd, stdin in COMMANDS:
+        ms = measure([sys.executable, '-m', 'sshkeys'] + cmd, stdin,
+                     args.repeat)
+        print('{:<16} {:>8.1f} ms {:>+8.1f} ms'.format(name, ms,
+                                                      ms - baseline))
+        if args.max_ms is not None and ms - baseline > args.max_ms:
+            failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
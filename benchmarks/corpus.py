@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""Synthetic key corpora for the benchmarks.
+
+The key material is random, but has the same structure and size as real
+keys. Corpora are generated from a fixed seed and are therefore identical
+between runs."""
+
+import random
+import struct
+from base64 import b64encode
+
+CURVES = {256: b'nistp256', 384: b'nistp384', 521: b'nistp521'}
+
+OPTIONS = 'no-pty,no-port-forwarding,from="10.0.0.0/8,*.example.com"'
+COMMAND = r'command="/usr/bin/rsync --server --sender -e \"-o x\" . /srv"'
+
+
+def pack(*fields):
+    return b''.join(struct.pack('!I', len(f)) + f for f in fields)
+
+
+def _random_bytes(rnd, n):
+    return bytes(bytearray(rnd.getrandbits(8) for _ in range(n)))
+
+
+def _mpint(rnd, bits):
+    # random positive integer with exactly the given number of bits
+    n = rnd.getrandbits(bits) | (1 << (bits - 1))
+    raw = n.to_bytes((bits + 7) // 8, 'big')
+    if bits % 8 == 0:
+        raw = b'\x00' + raw  # keep the sign bit clear
+    return raw
+
+
+def rsa_blob(rnd, bits):
+    return pack(b'ssh-rsa', b'\x01\x00\x01', _mpint(rnd, bits))
+
+
+def dsa_blob(rnd, bits=1024):
+    return pack(b'ssh-dss', _mpint(rnd, bits), _mpint(rnd, 160),
+                _mpint(rnd, bits), _mpint(rnd, bits))
+
+
+def ecdsa_blob(rnd, bits):
+    coord = (bits + 7) // 8
+    curve = CURVES[bits]
+    return pack(b'ecdsa-sha2-' + curve, curve,
+                b'\x04' + _random_bytes(rnd, 2 * coord))
+
+
+def line(blob, options=None, comment=None):
+    key_type = blob[4:4 + struct.unpack('!I', blob[:4])[0]].decode('ascii')
+    fields = [key_type, b64encode(blob).decode('ascii')]
+    if options:
+        fields.insert(0, options)
+    if comment is not None:
+        fields.append(comment)
+    return ' '.join(fields)
+
+
+def _corpus(n, seed, make_blob, options=None, comment='user{}@host'):
+    rnd = random.Random(seed)
+    return [line(make_blob(rnd), options, comment.format(i))
+            for i in range(n)]
+
+
+def corpora(n=1000):
+    """Return a dictionary of corpus name to a list of ``n`` key lines."""
+    result = {}
+    for bits in (1024, 2048, 4096, 8192, 16384):
+        result['rsa-%d' % bits] = _corpus(
+            n, bits, lambda rnd, bits=bits: rsa_blob(rnd, bits))
+    result['dsa-1024'] = _corpus(n, 'dsa', dsa_blob)
+    for bits in sorted(CURVES):
+        result['ecdsa-%d' % bits] = _corpus(
+            n, bits, lambda rnd, bits=bits: ecdsa_blob(rnd, bits))
+
+    rsa2048 = lambda rnd: rsa_blob(rnd, 2048)
+    result['rsa-2048-options'] = _corpus(n, 'opt', rsa2048, OPTIONS)
+    result['rsa-2048-command'] = _corpus(n, 'cmd', rsa2048, COMMAND)
+    result['rsa-2048-long-comment'] = _corpus(
+        n, 'comment', rsa2048, comment='{}' + 'x' * 1024)
+    return result
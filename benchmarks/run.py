@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmark parsing, serialization, fingerprinting and length checks on
+synthetic corpora.
+
+Run from the repository root:
+``PYTHONPATH=. python benchmarks/run.py [-o results.json]``
+
+Results are printed as a table and optionally written as JSON. Passing a
+previous result file with ``--compare`` prints the relative change and, with
+``--max-regression``, exits with a non-zero status if any benchmark got
+slower by more than the given fraction.
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import sshkeys
+from sshkeys import Key, iter_fingerprints
+from sshkeys.diff import diff
+from sshkeys.scan import scan_file
+
+from corpus import corpora
+
+
+def _time(fn, arg):
+    start = time.perf_counter()
+    fn(arg)
+    return time.perf_counter() - start
+
+
+def _fresh(keys):
+    # keys without cached fingerprints or encodings
+    return [type(k)(k.data, k.comment, k._options) for k in keys]
+
+
+def benchmarks(lines, tmpdir, name):
+    """Yield (benchmark name, callable, setup) for one corpus. ``setup`` is
+    called before every timed run and its result passed to the callable."""
+    keys = [Key.from_pubkey_line(l) for l in lines]
+    blobs = [k.data for k in keys]
+
+    fn = os.path.join(tmpdir, name)
+    with io.open(fn, 'w') as f:
+        f.write(u'\n'.join(lines) + u'\n')
+
+    nothing = lambda: None
+    yield ('from_pubkey_line',
+           lambda _: [Key.from_pubkey_line(l) for l in lines], nothing)
+    yield ('from_pubkey_line_lazy',
+           lambda _: [Key.from_pubkey_line(l, True) for l in lines], nothing)
+    yield ('_extract_options',
+           lambda _: [Key._extract_options(l) for l in lines], nothing)
+    yield ('to_pubkey_line',
+           lambda _: [k.to_pubkey_line() for k in keys], nothing)
+    yield ('to_pubkey_line_modified',
+           lambda ks: [k.to_pubkey_line() for k in ks],
+           lambda: _fresh(keys))
+    for alg in ('md5', 'sha256'):
+        yield ('fingerprint_' + alg,
+               lambda ks, alg=alg: [k.get_fingerprint(alg) for k in ks],
+               lambda: _fresh(keys))
+        yield ('iter_fingerprints_' + alg,
+               lambda _, alg=alg: list(iter_fingerprints(blobs, alg)),
+               nothing)
+    yield ('length',
+           lambda ks: [k.length for k in ks],
+           lambda: _fresh(keys))
+    yield ('iter_pubkey_file',
+           lambda _: list(Key.iter_pubkey_file(fn)), nothing)
+    yield ('scan_file',
+           lambda _: list(scan_file(fn)), nothing)
+    yield ('diff_file',
+           lambda _: list(diff(fn, keys[::10])), nothing)
+
+
+def run(n, repeat, only=None):
+    results = []
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for corpus, lines in sorted(corpora(n).items()):
+            if only and corpus not in only:
+                continue
+            nbytes = sum(len(l) + 1 for l in lines)
+            for bench, fn, setup in benchmarks(lines, tmpdir, corpus):
+                best = min(_time(fn, setup()) for _ in range(repeat))
+                results.append({
+                    'corpus': corpus,
+                    'benchmark': bench,
+                    'n': n,
+                    'seconds': best,
+                    'ops_per_sec': n / best,
+                    'bytes_per_sec': nbytes / best,
+                })
+    finally:
+        shutil.rmtree(tmpdir)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', type=int, default=1000,
+                        help='keys per corpus')
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    parser.add_argument('-c', '--corpus', action='append',
+                        help='only run the given corpus (repeatable)')
+    parser.add_argument('-o', '--output', help='write results as JSON')
+    parser.add_argument('--compare', help='JSON results to compare with')
+    parser.add_argument('--max-regression', type=float, default=None,
+                        help='fail if ops/s drop by more than this fraction')
+    args = parser.parse_args()
+
+    results = run(args.n, args.repeat, args.corpus)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            for r in json.load(f)['results']:
+                baseline[r['corpus'], r['benchmark']] = r
+
+    failed = False
+    for r in results:
+        row = '{corpus:<24} {benchmark:<26} {ops_per_sec:>12.0f} ops/s ' \
+              '{mb:>9.2f} MB/s'.format(mb=r['bytes_per_sec'] / 1e6, **r)
+        old = baseline.get((r['corpus'], r['benchmark']))
+        if old:
+            change = r['ops_per_sec'] / old['ops_per_sec'] - 1
+            row += ' {:>+7.1%}'.format(change)
+            if (args.max_regression is not None and
+                    change < -args.max_regression):
+                failed = True
+        print(row)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'sshkeys_version': sshkeys.__version__,
+                'python': platform.python_version(),
+                'implementation': platform.python_implementation(),
+                'platform': platform.platform(),
+                'timestamp': time.time(),
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
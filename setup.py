@@ -20,5 +20,15 @@ setup(
     url='http://github.com/mbr/sshkeys',
     license='MIT',
     packages=find_packages(exclude=['tests']),
-    install_requires=['six'],
+    # Python 2 is no longer supported; sshkeys.aio needs
+    # asyncio.get_running_loop()
+    python_requires='>=3.7',
+    classifiers=[
+        'License :: OSI Approved :: MIT License',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
+    ],
+    entry_points={
+        'console_scripts': ['sshkeys = sshkeys.cli:main'],
+    },
 )
@@ -1,37 +1,445 @@
 import binascii
+import io
+import os
+import re
+import stat
+import time
 from base64 import b64decode, b64encode
 from collections import OrderedDict
-from hashlib import md5
-from struct import unpack
-
-from six import byte2int
+from collections.abc import Mapping
+from hashlib import md5, sha1, sha256
+from struct import Struct, error as struct_error
 
 __version__ = '0.6.dev1'
 
 
-def iter_prefixed(data):
-    while data:
-        # get next prefix
-        l = unpack('!I', data[:4])[0]
-        packet, data = data[4:4 + l], data[4 + l:]
-        yield packet
+_UINT32 = Struct('!I')
+_UINT64 = Struct('!Q')
+
+
+def _field_bounds(view, offset, end):
+    # returns start and end offset of the field whose length prefix is
+    # located at offset
+    if end - offset < 4:
+        raise ValueError('Truncated length prefix at offset {}'.format(offset))
+    start = offset + 4
+    stop = start + _UINT32.unpack_from(view, offset)[0]
+    if stop > end:
+        raise ValueError('Field at offset {} exceeds data by {} bytes'
+                         .format(offset, stop - end))
+    return start, stop
+
+
+def read_prefixed(data, offset=0, copy=True):
+    """Read a single length-prefixed field from ``data``, starting at
+    ``offset``. Returns a tuple of the field and the offset of the next field.
+
+    If ``copy`` is ``False``, the field is returned as a ``memoryview`` into
+    ``data`` instead of ``bytes``. Raises ``ValueError`` if the data is
+    truncated."""
+    view = memoryview(data)
+    start, stop = _field_bounds(view, offset, len(view))
+    field = view[start:stop]
+    return (field.tobytes() if copy else field), stop
+
+
+def iter_prefixed(data, copy=True):
+    """Iterate over all length-prefixed fields in ``data``, as found in the
+    SSH wire format.
+
+    The buffer is walked by offset, without slicing off the remainder after
+    every field. If ``copy`` is ``False``, ``memoryview`` objects into
+    ``data`` are yielded instead of ``bytes``. Raises ``ValueError`` if a
+    length prefix is truncated or points past the end of the data."""
+    view = memoryview(data)
+    end = len(view)
+    offset = 0
+    while offset < end:
+        start, offset = _field_bounds(view, offset, end)
+        field = view[start:offset]
+        yield field.tobytes() if copy else field
+
+
+def _peek_type(data64):
+    # decodes only as much of the base64 encoded blob as is needed to read
+    # the leading key type field
+    head = b64decode(data64[:8])
+    if len(head) < 4:
+        raise ValueError('Truncated length prefix')
+    nbytes = 4 + _UINT32.unpack_from(head)[0]
+    return read_prefixed(b64decode(data64[:-(-nbytes // 3) * 4]))[0]
+
+
+_UNQUOTED_RUN = re.compile(r'[^ ",=]+')
+_QUOTED_RUN = re.compile(r'[^"\\]+')
+_ESCAPE_RUN = re.compile(r'\\+(.?)', re.DOTALL)
+
+
+# maps every supported key type to the Key subclass handling it. Types are
+# stored both as text (as found in front of the key data) and as bytes (as
+# found inside it), so that either can be looked up directly
+KEY_TYPES = {}
+
+
+def register_key_type(*names):
+    """Class decorator registering a :class:`Key` subclass as the handler
+    for the given key type names."""
+    def register(cls):
+        for name in names:
+            KEY_TYPES[name] = cls
+            KEY_TYPES[name.encode('ascii')] = cls
+        return cls
+    return register
+
+
+FINGERPRINT_ALGORITHMS = {
+    'md5': md5,
+    'sha1': sha1,
+    'sha256': sha256,
+}
+
+
+def _hash_constructor(alg):
+    try:
+        return FINGERPRINT_ALGORITHMS[alg]
+    except KeyError:
+        raise ValueError('Unsupported fingerprint algorithm {!r}'.format(alg))
+
+
+def format_fingerprint(digest, alg='md5'):
+    """Format a raw fingerprint the way OpenSSH displays it, e.g.
+    ``'MD5:b9:e2:58:...'`` or ``'SHA256:zoVoh6gre0C/0p1pGCUFiPGvcE703s...'``.
+    """
+    if alg == 'md5':
+        h = binascii.hexlify(digest).decode()
+        return 'MD5:' + ':'.join(h[i:i + 2] for i in range(0, len(h), 2))
+    return '{}:{}'.format(alg.upper(),
+                          b64encode(digest).decode('ascii').rstrip('='))
+
+
+def parse_fingerprint(text):
+    """Parse a fingerprint as formatted by :func:`format_fingerprint`.
+    Returns a tuple of the algorithm and the raw digest. Colon-separated hex
+    strings without a prefix are taken to be MD5."""
+    alg, sep, value = text.partition(':')
+    if not sep or len(alg) == 2:
+        alg, value = 'MD5', text
+    alg = alg.lower()
+    _hash_constructor(alg)
+
+    try:
+        if alg == 'md5':
+            return alg, binascii.unhexlify(value.replace(':', ''))
+        return alg, b64decode(value + '=' * (-len(value) % 4))
+    except ValueError:  # binascii.Error, or non-ASCII characters
+        raise ValueError('Invalid fingerprint {!r}'.format(text))
+
+
+def iter_fingerprints(keys, alg='md5'):
+    """Fingerprint an iterable of keys in a single pass, yielding the raw
+    digests in order.
+
+    Items may be :class:`Key` instances or raw key blobs (``bytes``). Digests
+    already cached on a key are reused, newly computed ones are stored in the
+    key's cache."""
+    new = _hash_constructor(alg)
+    ins = _instrumentation
+    for key in keys:
+        if ins is not None:
+            start = _clock()
+
+        if not isinstance(key, Key):
+            digest = new(key).digest()
+        else:
+            fps = key._fingerprints
+            if fps is None:
+                fps = key._fingerprints = {}
+            digest = fps.get(alg)
+            if digest is None:
+                digest = fps[alg] = new(key.data).digest()
+
+        if ins is not None:
+            ins.lap('fingerprint', start)
+        yield digest
+
+
+_clock = time.perf_counter
+_instrumentation = None
+
+
+class Instrumentation(object):
+    """Counters for the stages of key parsing.
+
+    For each stage in :attr:`STAGES`, the number of times it ran and the
+    total time spent in it are recorded. Parse errors are counted by their
+    :attr:`KeyParseError.reason`. If a ``hook`` is given, it is called as
+    ``hook(stage, seconds)`` every time a stage completes.
+
+    Use :func:`enable_instrumentation` to install an instance; while none is
+    installed, parsing only pays for a check against ``None``."""
+
+    STAGES = ('options', 'decode', 'dispatch', 'fingerprint')
+
+    def __init__(self, hook=None):
+        self.hook = hook
+        self.reset()
+
+    def reset(self):
+        self.calls = dict.fromkeys(self.STAGES, 0)
+        self.seconds = dict.fromkeys(self.STAGES, 0.0)
+        self.errors = {}
+
+    def lap(self, stage, start):
+        """Record that ``stage`` ran from ``start`` (a :func:`time.perf_counter`
+        value) until now. Returns the current time, so that the next stage can
+        be timed from there."""
+        now = _clock()
+        self.calls[stage] += 1
+        self.seconds[stage] += now - start
+        if self.hook is not None:
+            self.hook(stage, now - start)
+        return now
+
+    def count_error(self, reason):
+        self.errors[reason] = self.errors.get(reason, 0) + 1
+
+    def snapshot(self, reset=False):
+        """Return a copy of the current counters, as a dictionary with the
+        keys ``calls``, ``seconds`` and ``errors``. If ``reset`` is true, the
+        counters are reset afterwards."""
+        snap = {
+            'calls': dict(self.calls),
+            'seconds': dict(self.seconds),
+            'errors': dict(self.errors),
+        }
+        if reset:
+            self.reset()
+        return snap
+
+
+def enable_instrumentation(hook=None):
+    """Install a new :class:`Instrumentation` and return it."""
+    global _instrumentation
+    _instrumentation = Instrumentation(hook)
+    return _instrumentation
+
+
+def disable_instrumentation():
+    """Remove the installed :class:`Instrumentation`, returning it (or
+    ``None``)."""
+    global _instrumentation
+    ins, _instrumentation = _instrumentation, None
+    return ins
+
+
+def get_instrumentation():
+    """Return the installed :class:`Instrumentation`, or ``None``."""
+    return _instrumentation
+
+
+class KeyParseError(ValueError):
+    """Raised when a public key cannot be parsed.
+
+    ``reason`` is a short, stable description of what went wrong (e.g.
+    ``'Empty key'``). When the error was encountered while reading a
+    multi-line source, ``lineno`` and ``line`` are set as well."""
+
+    def __init__(self, reason, detail=None, lineno=None, line=None):
+        if detail is None:
+            msg = reason
+        else:
+            msg = '{} {}'.format(reason, detail)
+        super(KeyParseError, self).__init__(msg)
+        self.reason = reason
+        self.lineno = lineno
+        self.line = line
+
+
+def _strip_line(line):
+    # returns the stripped line, or None for blank lines and comments. Lines
+    # read as bytes are decoded as UTF-8; invalid ones raise a KeyParseError
+    # holding the line with undecodable bytes escaped as surrogates, so it
+    # can be written back unchanged
+    if isinstance(line, bytes):
+        line = line.strip()
+        if not line or line.startswith(b'#'):
+            return None
+        try:
+            return line.decode('utf-8')
+        except UnicodeDecodeError as e:
+            raise KeyParseError('Invalid UTF-8',
+                                'at position {}'.format(e.start),
+                                line=line.decode('utf-8', 'surrogateescape'))
+
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    return line
+
+
+class _NoOptions(Mapping):
+    # read-only empty options, shared by all keys without options until
+    # their options are requested. Pickled and copied as a reference to the
+    # single instance
+    __slots__ = ()
+
+    def __getitem__(self, name):
+        raise KeyError(name)
+
+    def __iter__(self):
+        return iter(())
+
+    def __len__(self):
+        return 0
+
+    def __reduce__(self):
+        return '_NO_OPTIONS'
+
+
+_NO_OPTIONS = _NoOptions()
+
+
+def _format_options(options):
+    # formats (name, value) pairs as the options field of a key line
+    buf = []
+    for k, v in options:
+        if v is True:  # NOT the same as 'if v:'!
+            buf.append(k)
+        else:
+            buf.append('%s="%s"' % (k, v.replace('"', r'\"')))
+    return ','.join(buf)
+
+
+class _HandedOutOptions(OrderedDict):
+    # options handed out by a key that still holds its original line. They
+    # may be changed in place, so to_pubkey_line compares them to the line
+    # instead of trusting it
+
+    def __repr__(self):
+        return repr(OrderedDict(self))
 
 
 class Key(object):
+    __slots__ = ('_data', '_data64', '_fingerprints', '_type', '_options',
+                 '_components', '_comment', '_line')
+
+    #: names of the fields following the key type in the key data
+    fields = ()
+    # conversions applied to the raw field data when decoding
+    _converters = {}
+
     def __init__(self, data, comment=None, options=None):
         self.data = data
         self.comment = comment
-        self.options = options or OrderedDict()
+        self.options = options
+
+    @classmethod
+    def _from_line(cls, line, data, key_type, comment, options):
+        # creates a key parsed from line. if data is None, it is decoded from
+        # the line when first accessed
+        key = cls(data, comment, options)
+        key._type = key_type
+        # as long as the key is unmodified, line is kept instead of the
+        # base64 encoded data
+        key._line = line
+        return key
+
+    def _get_data64(self):
+        # returns the original base64 encoded data, if any
+        if self._data64 is None and self._line is not None:
+            return self._extract_options(self._line)[1].split(None, 2)[1]
+        return self._data64
+
+    def _detach(self):
+        # called before modifications that make the original line unusable
+        if self._line is not None:
+            self._data64 = self._get_data64()
+            self._line = None
+
+    def __eq__(self, other):
+        if not isinstance(other, Key):
+            return NotImplemented
+        return self.data == other.data
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
+
+    def __hash__(self):
+        return hash(self.data)
 
     @property
     def data(self):
+        if self._data is None:
+            data64 = self._get_data64()
+            if data64 is None:
+                return None
+
+            ins = _instrumentation
+            if ins is not None:
+                start = _clock()
+            try:
+                self._data = b64decode(data64)
+            except ValueError:
+                if ins is not None:
+                    ins.count_error('Key contains invalid data')
+                raise KeyParseError('Key contains invalid data')
+            if ins is not None:
+                ins.lap('decode', start)
         return self._data
 
     @data.setter
     def data(self, val):
         self._data = val
-        self._fingerprint = None
+        self._data64 = None
+        self._line = None
+        self._fingerprints = None
         self._type = None
+        self._components = None
+
+    @property
+    def options(self):
+        # reading the options does not detach the key from its line: they
+        # are marked as handed out, so that to_pubkey_line checks whether
+        # they were modified in place
+        options = self._options
+        if self._line is not None:
+            if not isinstance(options, _HandedOutOptions):
+                options = self._options = _HandedOutOptions(options)
+        elif options is _NO_OPTIONS:
+            options = self._options = OrderedDict()
+        return options
+
+    @options.setter
+    def options(self, val):
+        self._detach()
+        self._options = val or _NO_OPTIONS
+
+    @property
+    def comment(self):
+        return self._comment
+
+    @comment.setter
+    def comment(self, val):
+        self._detach()
+        self._comment = val
+
+    def _decode(self):
+        # decodes the fields named in `fields`, the result is cached until the
+        # data is replaced
+        if self._components is None:
+            values = list(iter_prefixed(self.data))[1:]
+            if len(values) != len(self.fields):
+                raise ValueError('Expected {} fields in {} key, found {}'
+                                 .format(len(self.fields), self.type,
+                                         len(values)))
+
+            components = {}
+            for name, value in zip(self.fields, values):
+                convert = self._converters.get(name)
+                components[name] = value if convert is None else convert(value)
+            self._components = components
+        return self._components
 
     @property
     def length(self):
@@ -40,20 +448,47 @@ class Key(object):
     @property
     def type(self):
         if not self._type:
-            self._type = next(iter_prefixed(self.data))
+            self._type = read_prefixed(self.data)[0]
 
         return self._type.decode('ascii')
 
+    def get_fingerprint(self, alg='md5'):
+        """Return the raw fingerprint of the key, using one of the algorithms
+        in :data:`FINGERPRINT_ALGORITHMS`. Results are cached per
+        algorithm."""
+        fps = self._fingerprints
+        if fps is None:
+            fps = self._fingerprints = {}
+
+        digest = fps.get(alg)
+        if digest is None:
+            ins = _instrumentation
+            if ins is not None:
+                start = _clock()
+            digest = fps[alg] = _hash_constructor(alg)(self.data).digest()
+            if ins is not None:
+                ins.lap('fingerprint', start)
+        return digest
+
+    @property
+    def fingerprint_key(self):
+        """The key whose fingerprint ``ssh-keygen -l`` shows: the key itself,
+        or the certified key of a certificate."""
+        return self
+
+    def get_readable_fingerprint(self, alg='md5'):
+        """Return the fingerprint formatted like OpenSSH does, see
+        :func:`format_fingerprint`."""
+        return format_fingerprint(self.get_fingerprint(alg), alg)
+
     @property
     def fingerprint(self):
-        if not self._fingerprint:
-            self._fingerprint = md5(self._data).digest()
-        return self._fingerprint
+        return self.get_fingerprint('md5')
 
     @property
     def readable_fingerprint(self):
-        h = binascii.hexlify(self.fingerprint).decode()
-        return ':'.join(h[i:i + 2] for i in range(0, len(h), 2))
+        # colon-separated MD5, as shown by OpenSSH before 6.8
+        return self.get_readable_fingerprint('md5')[4:]
 
     @staticmethod
     def _extract_options(line):
@@ -66,84 +501,131 @@ class Key(object):
         >>> Key._extract_options(r'ssh-rsa AAAAB3NzaC1yc...Lwc8OFy5Lo+kU=')
         (OrderedDict(), 'ssh-rsa AAAAB3NzaC1yc...Lwc8OFy5Lo+kU=')
         '''
-        options = OrderedDict({})
-        quoted = False
-        escaped = False
+        line = line.strip()
+
+        # fast path: most lines carry no options and start with the key type
+        m = _UNQUOTED_RUN.match(line)
+        if (m and line[m.end():m.end() + 1] == ' ' and
+                m.group() in KEY_TYPES):
+            return OrderedDict(), line
+
+        options = OrderedDict()
         option_name = ''
-        option_val = None
-        key_without_options = ''
-        in_options = True
-        in_option_name = True
-        for letter in line.strip():
-            if in_options:
-                if quoted:
-                    if letter == "\\":
-                        escaped = True
-                    elif letter == '"':
-                        if escaped:
-                            option_val += letter
-                            escaped = False
-                        else:
-                            quoted = False
+        option_val = None  # None while still reading the option name
+        pos = 0
+        end = len(line)
+        while pos < end:
+            letter = line[pos]
+            if letter == ' ':
+                # end of options
+                break
+            elif letter == ',':
+                # next option_name
+                options[option_name] = (True if option_val is None
+                                        else option_val)
+                option_name = ''
+                option_val = None
+                pos += 1
+            elif letter == '=':
+                # '=' separates option name from value, any further '=' are
+                # dropped
+                if option_val is None:
+                    option_val = ''
+                pos += 1
+            elif letter == '"':
+                chunks = []
+                pos += 1
+                while pos < end:
+                    m = _QUOTED_RUN.match(line, pos)
+                    if m:
+                        chunks.append(m.group())
+                        pos = m.end()
+                    elif line[pos] == '"':
+                        break
                     else:
-                        if escaped:
-                            option_val += "\\"
-                            escaped = False
-                        option_val += letter
-                else:  # not quoted
-                    if letter == ' ':
-                        # end of options
-                        in_options = False
-                        if (option_name in ['ssh-rsa', 'ssh-dss'] or
-                            option_name.startswith('ecdsa-')):
-                            # what we thought was an option name was really the
-                            # key type, and there are no options
-                            key_without_options = option_name + " "
-                            option_name = ''
-                        else:
-                            if option_val is None:
-                                options[option_name] = True
-                            else:
-                                options[option_name] = option_val
-                    elif letter == '"':
-                        quoted = True
-                    elif letter == '=':
-                        # '=' separated option name from value
-                        in_option_name = False
-                        if option_val is None:
-                            option_val = ''
-                    elif letter == ',':
-                        # next option_name
-                        if option_val is None:
-                            options[option_name] = True
-                        else:
-                            options[option_name] = option_val
-                        in_option_name = True
-                        option_name = ''
-                        option_val = None
-                    else:  # general unquoted letter
-                        if in_option_name:
-                            option_name += letter
-                        else:
-                            option_val += letter
+                        # a run of backslashes escapes a quote, but is
+                        # otherwise collapsed into a single backslash
+                        m = _ESCAPE_RUN.match(line, pos)
+                        escaped = m.group(1)
+                        if escaped == '"':
+                            chunks.append('"')
+                        elif escaped:
+                            chunks.append('\\' + escaped)
+                        pos = m.end()
+                # skip closing quote. an unterminated quote swallows the rest
+                # of the line
+                pos += 1
+                if chunks:
+                    if option_val is None:
+                        raise KeyParseError('Malformed options')
+                    option_val += ''.join(chunks)
+            else:  # run of general unquoted letters
+                m = _UNQUOTED_RUN.match(line, pos)
+                if option_val is None:
+                    option_name += m.group()
+                else:
+                    option_val += m.group()
+                pos = m.end()
+
+        key_without_options = ''
+        if pos < end:
+            if option_name in KEY_TYPES:
+                # what we thought was an option name was really the key type,
+                # and there are no options
+                key_without_options = option_name + ' ' + line[pos + 1:]
             else:
-                key_without_options += letter
+                options[option_name] = (True if option_val is None
+                                        else option_val)
+                key_without_options = line[pos + 1:]
+
         if key_without_options == '':
             # certain mal-formed keys (e.g. a line not containing any spaces)
             # will be completely swallowed up by the above parser. It's
             # better to follow the principle of least surprize and return the
             # original line, allowing the error to be handled later.
-            return OrderedDict({}), line.strip()
-        else:
-            return options, key_without_options
+            return OrderedDict({}), line
+        return options, key_without_options
+
+    @staticmethod
+    def _class_for_type(key_type):
+        # returns the subclass handling key_type, as found in the key data
+        try:
+            return KEY_TYPES[key_type]
+        except KeyError:
+            raise KeyParseError('Unknown key type', key_type)
 
     @classmethod
-    def from_pubkey_line(cls, line):
+    def from_pubkey_line(cls, line, lazy=False):
         """Generate Key instance from a a string. Raise ValueError if string is
-        malformed"""
+        malformed.
+
+        If ``lazy`` is ``True``, only the key type is decoded up front; the
+        rest of the key data is decoded when it is first needed. In that case,
+        invalid key data is reported by the first access to ``data``,
+        ``fingerprint`` or ``length`` instead.
+
+        Until a key is modified, it keeps ``line`` so that it can be written
+        back verbatim. Eager keys hold the decoded data as well, which costs
+        roughly the size of the line again; lazy keys only decode it on
+        demand."""
+        ins = _instrumentation
+        if ins is None:
+            return cls._from_pubkey_line(line, lazy, None)
+
+        try:
+            return cls._from_pubkey_line(line, lazy, ins)
+        except KeyParseError as e:
+            ins.count_error(e.reason)
+            raise
+
+    @classmethod
+    def _from_pubkey_line(cls, line, lazy, ins):
+        if ins is not None:
+            start = _clock()
+
         options, key_without_options = cls._extract_options(line)
         if key_without_options == '':
-            raise ValueError("Empty key")
+            raise KeyParseError('Empty key')
         # the key (with options stripped out) should consist of the fields
         # "type", "data", and optionally "comment", separated by a space.
         # The comment field may contain additional spaces
@@ -154,25 +636,30 @@ class Key(object):
             type_str, data64 = fields
             comment = None
         else:  # len(fields) <= 1
-            raise ValueError("Key has insufficient number of fields")
+            raise KeyParseError('Key has insufficient number of fields')
+
+        if ins is not None:
+            start = ins.lap('options', start)
 
         try:
-            data = b64decode(data64)
-        except (binascii.Error, TypeError):
-            raise ValueError("Key contains invalid data")
-
-        key_type = next(iter_prefixed(data))
-
-        if key_type == b'ssh-rsa':
-            key_class = RSAKey
-        elif key_type == b'ssh-dss':
-            key_class = DSAKey
-        elif key_type.startswith(b'ecdsa-'):
-            key_class = ECDSAKey
-        else:
-            raise ValueError('Unknown key type {}'.format(key_type))
+            if lazy:
+                data = None
+                key_type = _peek_type(data64)
+            else:
+                data = b64decode(data64)
+                key_type = read_prefixed(data)[0]
+        except ValueError:
+            raise KeyParseError('Key contains invalid data')
+
+        if ins is not None:
+            start = ins.lap('decode', start)
 
-        return key_class(b64decode(data64), comment, options=options)
+        key = cls._class_for_type(key_type)._from_line(
+            line.strip(), data, key_type, comment, options)
+
+        if ins is not None:
+            ins.lap('dispatch', start)
+        return key
 
     @classmethod
     def from_pubkey_file(cls, file):
@@ -181,51 +668,440 @@ class Key(object):
         if hasattr(file, 'read'):
             return cls.from_pubkey_line(file.read())
 
-        return cls.from_pubkey_line(open(file).read())
+        with open(file) as f:
+            return cls.from_pubkey_line(f.read())
+
+    @classmethod
+    def iter_pubkey_file(cls, file, lazy=False):
+        """Iterate over the keys in a file in ``authorized_keys`` format.
+
+        ``file`` may be a filename or a file-like object, opened in text or
+        binary mode. The file is read line by line; blank lines and comments
+        are skipped. For every other line, a ``(lineno, key)`` tuple is
+        yielded. Lines that fail to parse do not abort the iteration,
+        ``(lineno, error)`` is yielded instead, with ``error`` being a
+        :class:`KeyParseError`. This includes lines of binary files that are
+        not valid UTF-8. ``lazy`` is passed on to :meth:`from_pubkey_line`."""
+        if not hasattr(file, 'read'):
+            with open(file, 'rb') as f:
+                for item in cls.iter_pubkey_file(f, lazy):
+                    yield item
+            return
+
+        for item in cls.iter_pubkey_lines(file, lazy):
+            yield item
+
+    @classmethod
+    def iter_pubkey_lines(cls, lines, lazy=False, start=1):
+        """Like :meth:`iter_pubkey_file`, but for an iterable of lines
+        (strings or bytes), the first of which is numbered ``start``."""
+        for lineno, line in enumerate(lines, start):
+            try:
+                line = _strip_line(line)
+                if line is None:
+                    continue
+                key = cls.from_pubkey_line(line, lazy)
+            except KeyParseError as e:
+                e.lineno = lineno
+                if e.line is None:
+                    e.line = line
+                yield lineno, e
+                continue
+            yield lineno, key
 
     def to_pubkey_line(self):
-        fields = [self.type, b64encode(self.data).decode('ascii')]
+        """Return the key in ``authorized_keys`` format. Keys that have not
+        been modified since they were parsed return their original line."""
+        if self._line is not None:
+            options = self._options
+            if (not isinstance(options, _HandedOutOptions) or
+                    options == self._extract_options(self._line)[0]):
+                return self._line
+            self._detach()
 
-        if self.options:
-            buf = []
-            for k, v in self.options.items():
-                if v is True:  # NOT the same as 'if v:'!
-                    buf.append(k)
-                else:
-                    buf.append('%s="%s"' % (k, v.replace('"', r'\"')))
-            fields.insert(0, ','.join(buf))
+        data64 = self._data64
+        if data64 is None:
+            data64 = b64encode(self.data).decode('ascii')
+        fields = [self.type, data64]
+
+        if self._options:
+            fields.insert(0, _format_options(self._options.items()))
 
-        if self.comment is not None:
-            fields.append(self.comment)
+        if self._comment is not None:
+            fields.append(self._comment)
 
         return ' '.join(fields)
 
 
+_WRITE_BUFFER = 1 << 16
+
+# undecodable bytes of lines that were read as errors are written back as-is
+_WRITE_ENCODING = {'encoding': 'utf-8', 'errors': 'surrogateescape'}
+
+
+def write_pubkey_file(entries, file, atomic=False):
+    """Write keys to a file in ``authorized_keys`` format, one per line.
+
+    ``entries`` may contain keys, the ``(lineno, key)`` tuples produced by
+    :meth:`Key.iter_pubkey_file` (for parse errors, the original line is
+    written) or strings, which are written verbatim. Unmodified keys are
+    written exactly as they were read. Files are written as UTF-8.
+
+    ``file`` may be a file-like object or a filename. If ``atomic`` is true,
+    ``file`` must be a filename; the keys are written to a temporary file in
+    the same directory, which then replaces ``file`` (or the file it links
+    to), keeping its permissions and, where allowed, its owner. Returns the
+    number of lines written."""
+    if atomic:
+        import tempfile
+
+        # replace the file a symlink points to, not the symlink itself
+        target = os.path.realpath(file)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target),
+                                   prefix='.sshkeys-')
+        try:
+            try:
+                st = os.stat(target)
+            except OSError:
+                st = None  # new file, keep mkstemp's restrictive default
+            if st is not None:
+                os.chmod(tmp, stat.S_IMODE(st.st_mode))
+                tmp_st = os.fstat(fd)
+                if ((tmp_st.st_uid, tmp_st.st_gid) != (st.st_uid, st.st_gid)
+                        and hasattr(os, 'chown')):
+                    try:
+                        os.chown(tmp, st.st_uid, st.st_gid)
+                    except OSError:
+                        pass  # only root may give files away
+
+            with io.open(fd, 'w', buffering=_WRITE_BUFFER,
+                         **_WRITE_ENCODING) as f:
+                fd = None  # closed by f from now on
+                count = write_pubkey_file(entries, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, target)
+        except BaseException:
+            if fd is not None:
+                os.close(fd)
+            os.unlink(tmp)
+            raise
+        return count
+
+    if not hasattr(file, 'write'):
+        with io.open(file, 'w', buffering=_WRITE_BUFFER,
+                     **_WRITE_ENCODING) as f:
+            return write_pubkey_file(entries, f)
+
+    write = file.write
+    count = 0
+    for entry in entries:
+        if isinstance(entry, tuple):
+            entry = entry[1]
+
+        if isinstance(entry, Key):
+            line = entry.to_pubkey_line()
+        elif isinstance(entry, KeyParseError):
+            if entry.line is None:
+                continue
+            line = entry.line
+        else:
+            line = entry
+
+        write(line + '\n')
+        count += 1
+    return count
+
+
+def _component(name, doc):
+    return property(lambda self: self._decode()[name], doc=doc)
+
+
+def _mpint(data):
+    return int.from_bytes(data, 'big', signed=True)
+
+
+@register_key_type('ssh-rsa')
 class RSAKey(Key):
+    __slots__ = ()
+
+    fields = ('e', 'n')
+    _converters = {'e': _mpint, 'n': _mpint}
+
+    e = _component('e', 'Public exponent.')
+    n = _component('n', 'Modulus.')
+
     @property
     def length(self):
-        prefix, exp, n = [p for p in iter_prefixed(self.data)]
+        return self.n.bit_length()
 
-        l = (len(n) - 1) * 8
 
-        # the first bit is the sign and should always be 0
-        # all bits below the highest non-0 bit are part of the modulus
-        tmp = byte2int(n)
-        while tmp:
-            tmp >>= 1
-            l += 1
+@register_key_type('ssh-dss')
+class DSAKey(Key):
+    __slots__ = ()
 
-        return l
+    fields = ('p', 'q', 'g', 'y')
+    _converters = dict.fromkeys(fields, _mpint)
 
+    p = _component('p', 'Prime modulus.')
+    q = _component('q', 'Prime divisor of ``p - 1``.')
+    g = _component('g', 'Generator.')
+    y = _component('y', 'Public key.')
 
-class DSAKey(Key):
-    length = 1024
+    @property
+    def length(self):
+        return self.p.bit_length()
 
 
+@register_key_type('ecdsa-sha2-nistp256', 'ecdsa-sha2-nistp384',
+                   'ecdsa-sha2-nistp521')
 class ECDSAKey(Key):
+    __slots__ = ()
+
+    fields = ('curve', 'point')
+    _converters = {'curve': lambda v: v.decode('ascii')}
+
+    curve = _component('curve', 'Name of the curve, e.g. ``\'nistp256\'``.')
+    point = _component('point', 'Encoded public point (bytes).')
+
     @property
     def length(self):
-        type, curve, data = [p for p in iter_prefixed(self.data)]
-        if not curve.startswith(b'nistp'):
+        curve = self.curve
+        if not curve.startswith('nistp'):
             raise NotImplementedError('Cannot determine length of curve')
         return int(curve[5:])
+
+
+@register_key_type('ssh-ed25519')
+class Ed25519Key(Key):
+    __slots__ = ()
+
+    fields = ('pk',)
+
+    pk = _component('pk', 'Public key (bytes).')
+
+    length = 256
+
+
+@register_key_type('sk-ecdsa-sha2-nistp256@openssh.com')
+class SKECDSAKey(ECDSAKey):
+    """An ECDSA key held by a FIDO security key."""
+    __slots__ = ()
+
+    fields = ('curve', 'point', 'application')
+    _converters = dict(ECDSAKey._converters,
+                       application=lambda v: v.decode('utf-8', 'replace'))
+
+    application = _component('application', 'FIDO application string.')
+
+
+@register_key_type('sk-ssh-ed25519@openssh.com')
+class SKEd25519Key(Ed25519Key):
+    """An Ed25519 key held by a FIDO security key."""
+    __slots__ = ()
+
+    fields = ('pk', 'application')
+    _converters = {'application': lambda v: v.decode('utf-8', 'replace')}
+
+    application = _component('application', 'FIDO application string.')
+
+
+def _read_uint(data, offset, fmt):
+    try:
+        return fmt.unpack_from(data, offset)[0], offset + fmt.size
+    except struct_error:
+        raise ValueError('Truncated integer at offset {}'.format(offset))
+
+
+def _iter_pairs(data):
+    # iterates over name/value pairs, as used for certificate options. Values
+    # are wrapped in another string if present.
+    fields = iter_prefixed(data)
+    for name in fields:
+        value = next(fields, b'')
+        if value:
+            value = read_prefixed(value)[0]
+        yield name.decode('utf-8'), value.decode('utf-8', 'replace')
+
+
+# certificate types and the types of the keys they certify
+_CERT_TYPES = {
+    'ssh-rsa-cert-v01@openssh.com': 'ssh-rsa',
+    'ssh-dss-cert-v01@openssh.com': 'ssh-dss',
+    'ecdsa-sha2-nistp256-cert-v01@openssh.com': 'ecdsa-sha2-nistp256',
+    'ecdsa-sha2-nistp384-cert-v01@openssh.com': 'ecdsa-sha2-nistp384',
+    'ecdsa-sha2-nistp521-cert-v01@openssh.com': 'ecdsa-sha2-nistp521',
+    'ssh-ed25519-cert-v01@openssh.com': 'ssh-ed25519',
+    'sk-ecdsa-sha2-nistp256-cert-v01@openssh.com':
+        'sk-ecdsa-sha2-nistp256@openssh.com',
+    'sk-ssh-ed25519-cert-v01@openssh.com': 'sk-ssh-ed25519@openssh.com',
+}
+
+
+@register_key_type(*_CERT_TYPES)
+class CertificateKey(Key):
+    """An OpenSSH certificate. Its fields are decoded on first access."""
+    __slots__ = ()
+
+    USER_CERT = 1
+    HOST_CERT = 2
+
+    @property
+    def public_key_type(self):
+        """The type of the certified key, e.g. ``'ssh-rsa'``."""
+        return _CERT_TYPES[self.type]
+
+    def _decode(self):
+        if self._components is not None:
+            return self._components
+
+        data = self.data
+        base_type = self.public_key_type
+        base_class = KEY_TYPES[base_type]
+
+        c = {}
+        offset = read_prefixed(data, copy=False)[1]
+        c['nonce'], offset = read_prefixed(data, offset)
+        start = offset
+        for _ in base_class.fields:
+            offset = read_prefixed(data, offset, copy=False)[1]
+        c['public_key'] = base_class(
+            _UINT32.pack(len(base_type)) + base_type.encode('ascii') +
+            data[start:offset])
+        c['serial'], offset = _read_uint(data, offset, _UINT64)
+        c['cert_type'], offset = _read_uint(data, offset, _UINT32)
+        key_id, offset = read_prefixed(data, offset)
+        c['key_id'] = key_id.decode('utf-8', 'replace')
+        principals, offset = read_prefixed(data, offset)
+        c['principals'] = [p.decode('utf-8', 'replace')
+                           for p in iter_prefixed(principals)]
+        c['valid_after'], offset = _read_uint(data, offset, _UINT64)
+        c['valid_before'], offset = _read_uint(data, offset, _UINT64)
+        critical_options, offset = read_prefixed(data, offset)
+        c['critical_options'] = OrderedDict(_iter_pairs(critical_options))
+        extensions, offset = read_prefixed(data, offset)
+        c['extensions'] = OrderedDict(_iter_pairs(extensions))
+        offset = read_prefixed(data, offset, copy=False)[1]  # reserved
+        c['signature_key'], offset = read_prefixed(data, offset)
+        c['signature'], offset = read_prefixed(data, offset)
+
+        self._components = c
+        return c
+
+    @property
+    def public_key(self):
+        """The certified key, as an instance of the matching :class:`Key`
+        subclass."""
+        return self._decode()['public_key']
+
+    @property
+    def fingerprint_key(self):
+        return self.public_key
+
+    @property
+    def length(self):
+        return self.public_key.length
+
+    nonce = _component('nonce', 'Random nonce (bytes).')
+    serial = _component('serial', 'Serial number.')
+    cert_type = _component('cert_type',
+                           ':attr:`USER_CERT` or :attr:`HOST_CERT`.')
+    key_id = _component('key_id', 'Key identifier.')
+    principals = _component('principals',
+                            'List of valid principals, empty if valid for '
+                            'any.')
+    valid_after = _component('valid_after', 'Start of the validity period '
+                             '(seconds since the epoch).')
+    valid_before = _component('valid_before', 'End of the validity period '
+                              '(seconds since the epoch).')
+    critical_options = _component('critical_options',
+                                  'OrderedDict of critical options.')
+    extensions = _component('extensions', 'OrderedDict of extensions.')
+    signature_key = _component('signature_key',
+                               'Key data of the signing CA (bytes).')
+    signature = _component('signature', 'Signature (bytes).')
+
+
+class KeyIndex(object):
+    """A set of keys, indexed by a SHA256 digest of their data.
+
+    Every distinct key is stored only once, together with the locations
+    (e.g. file name and line number) it was added from. Membership tests and
+    lookups by key, type or comment are dictionary lookups."""
+
+    def __init__(self, keys=()):
+        self._keys = {}
+        self._locations = {}
+        self._by_type = {}
+        self._by_comment = {}
+
+        for key in keys:
+            self.add(key)
+
+    @staticmethod
+    def digest(key):
+        """Return the digest a key is indexed by."""
+        return key.get_fingerprint('sha256')
+
+    def add(self, key, source=None, lineno=None):
+        """Add a key to the index, optionally recording where it was found.
+
+        Returns the indexed key, which is the first instance added with the
+        same data."""
+        digest = self.digest(key)
+        indexed = self._keys.setdefault(digest, key)
+        if indexed is key:
+            self._by_type.setdefault(key.type, set()).add(digest)
+
+        self._by_comment.setdefault(key.comment, set()).add(digest)
+
+        if source is not None or lineno is not None:
+            self._locations.setdefault(digest, []).append((source, lineno))
+
+        return indexed
+
+    def add_entries(self, entries, source=None):
+        """Add the ``(lineno, key)`` tuples produced by
+        :meth:`Key.iter_pubkey_file`. Entries holding parse errors are not
+        added, but returned as a list."""
+        errors = []
+        add = self.add
+        for lineno, key in entries:
+            if isinstance(key, Key):
+                add(key, source, lineno)
+            else:
+                errors.append(key)
+        return errors
+
+    def add_file(self, file, lazy=False):
+        """Add all keys from a file in ``authorized_keys`` format. Returns a
+        list of parse errors, see :meth:`add_entries`."""
+        source = getattr(file, 'name', file)
+        return self.add_entries(Key.iter_pubkey_file(file, lazy), source)
+
+    def get(self, key, default=None):
+        """Return the indexed key with the same data as ``key``."""
+        return self._keys.get(self.digest(key), default)
+
+    def locations(self, key):
+        """Return a list of ``(source, lineno)`` tuples ``key`` was found
+        at."""
+        return list(self._locations.get(self.digest(key), ()))
+
+    def by_type(self, type):
+        """Return a list of all indexed keys of a type, e.g. ``'ssh-rsa'``."""
+        return [self._keys[d] for d in self._by_type.get(type, ())]
+
+    def by_comment(self, comment):
+        """Return a list of all indexed keys that were added with
+        ``comment``."""
+        return [self._keys[d] for d in self._by_comment.get(comment, ())]
+
+    def __contains__(self, key):
+        return self.digest(key) in self._keys
+
+    def __iter__(self):
+        return iter(self._keys.values())
+
+    def __len__(self):
+        return len(self._keys)
@@ -0,0 +1,202 @@
+"""Loading keys from asyncio applications.
+
+The functions in this module mirror the file and line parsers of
+:class:`~sshkeys.Key`, but do not block the event loop: files are opened and
+read in an executor, and lines are parsed there in batches, so that a large
+file or stream only occupies the loop for as long as it takes to hand over
+a batch. Unless an executor is passed explicitly, a shared thread pool of
+:data:`MAX_WORKERS` threads is used.
+
+:func:`iter_keys` gathers keys from many sources (files, the output of
+subprocesses such as ``ssh-keygen -y``, sockets) at once, with a limit on how
+many of them are read concurrently."""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from . import Key
+
+#: Size of the default executor.
+MAX_WORKERS = 4
+
+#: Number of lines parsed per executor call.
+BATCH_SIZE = 256
+
+_CHUNK_SIZE = 1 << 16
+
+_default_executor = None
+
+
+def get_executor():
+    """Return the executor used if none is given, creating it on first
+    use."""
+    global _default_executor
+    if _default_executor is None:
+        _default_executor = ThreadPoolExecutor(
+            max_workers=MAX_WORKERS, thread_name_prefix='sshkeys')
+    return _default_executor
+
+
+def _run(executor, fn, *args):
+    return asyncio.get_running_loop().run_in_executor(
+        executor or get_executor(), fn, *args)
+
+
+def _parse_lines(lines, lazy, start):
+    return list(Key.iter_pubkey_lines(lines, lazy, start))
+
+
+def _read_batch(f, lazy, start, size):
+    # returns the parsed entries of the next size lines and the number of
+    # lines read, zero at the end of the file
+    lines = list(islice(f, size))
+    return _parse_lines(lines, lazy, start), len(lines)
+
+
+async def iter_pubkey_file(path, lazy=False, executor=None,
+                           batch_size=BATCH_SIZE):
+    """Asynchronously iterate over the keys in a file in ``authorized_keys``
+    format, yielding the same ``(lineno, key)`` tuples as
+    :meth:`Key.iter_pubkey_file`. The file is read and parsed in batches of
+    ``batch_size`` lines in ``executor``."""
+    f = await _run(executor, open, path, 'rb')
+    try:
+        lineno = 1
+        while True:
+            entries, count = await _run(executor, _read_batch, f, lazy,
+                                        lineno, batch_size)
+            if not count:
+                break
+            lineno += count
+            for entry in entries:
+                yield entry
+    finally:
+        await _run(executor, f.close)
+
+
+async def iter_pubkey_stream(reader, lazy=False, executor=None,
+                             batch_size=BATCH_SIZE, encoding=None):
+    """Like :func:`iter_pubkey_file`, but reading from an
+    :class:`asyncio.StreamReader` (e.g. the ``stdout`` of a subprocess or a
+    socket connection) until EOF. Lines are decoded as UTF-8, with lines
+    that are not valid UTF-8 yielded as errors, or using ``encoding`` if
+    given."""
+    lineno = 1
+    buf = b''
+    lines = []
+    eof = False
+    while not eof:
+        chunk = await reader.read(_CHUNK_SIZE)
+        if chunk:
+            buf += chunk
+            *complete, buf = buf.split(b'\n')
+            lines.extend(complete)
+        else:
+            eof = True
+            if buf:
+                lines.append(buf)
+
+        while len(lines) >= batch_size or (eof and lines):
+            batch = lines[:batch_size]
+            if encoding is not None:
+                batch = [l.decode(encoding, 'replace') for l in batch]
+            del lines[:batch_size]
+            entries = await _run(executor, _parse_lines, batch, lazy, lineno)
+            lineno += len(batch)
+            for entry in entries:
+                yield entry
+
+
+async def from_pubkey_file(path, executor=None):
+    """Asynchronous :meth:`Key.from_pubkey_file`."""
+    return await _run(executor, Key.from_pubkey_file, path)
+
+
+async def from_pubkey_stream(reader, executor=None, encoding='utf-8'):
+    """Read a single key from a stream, e.g. the output of ``ssh-keygen
+    -y``. Raises :class:`~sshkeys.KeyParseError` if it does not contain
+    exactly one valid key."""
+    data = await reader.read()
+    return await _run(executor, Key.from_pubkey_line,
+                      data.decode(encoding, 'replace'))
+
+
+def _iter_source(source, lazy, executor, batch_size):
+    if isinstance(source, (str, bytes, os.PathLike)):
+        return iter_pubkey_file(source, lazy, executor, batch_size)
+    return iter_pubkey_stream(source, lazy, executor, batch_size)
+
+
+async def _drain(source, queue, lazy, executor, batch_size):
+    # reads one source into the queue. Sources may be given as a callable
+    # returning an awaitable of a reader or a (reader, writer) tuple, as
+    # returned by asyncio.open_connection
+    writer = None
+    try:
+        if callable(source):
+            reader = await source()
+            if isinstance(reader, tuple):
+                reader, writer = reader
+        else:
+            reader = source
+        entries = _iter_source(reader, lazy, executor, batch_size)
+        try:
+            async for lineno, key in entries:
+                await queue.put((source, lineno, key))
+        finally:
+            await entries.aclose()
+    except OSError as e:
+        await queue.put((source, None, e))
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+async def iter_keys(sources, limit=8, lazy=False, executor=None,
+                    batch_size=BATCH_SIZE):
+    """Asynchronously iterate over the keys of many sources, reading at most
+    ``limit`` of them at the same time.
+
+    A source may be a path, an :class:`asyncio.StreamReader` or a callable
+    returning an awaitable of a stream reader or a ``(reader, writer)``
+    tuple, which allows opening connections only once they are read, e.g.
+    ``functools.partial(asyncio.open_unix_connection, path)``. Writers are
+    closed when the source has been read.
+
+    Yields ``(source, lineno, key)`` tuples as they become available, so
+    entries of different sources are interleaved; ``key`` is a
+    :class:`~sshkeys.KeyParseError` for lines that failed to parse. A source
+    that cannot be read yields a single ``(source, None, error)`` tuple with
+    the ``OSError`` raised."""
+    queue = asyncio.Queue(maxsize=limit * batch_size)
+    sources = iter(sources)
+    done = object()
+
+    async def worker():
+        # not signalling completion when cancelled, as nobody is reading the
+        # queue anymore and it might be full
+        try:
+            for source in sources:
+                await _drain(source, queue, lazy, executor, batch_size)
+        except Exception as e:
+            await queue.put((None, None, e))
+        await queue.put(done)
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(limit)]
+    try:
+        running = len(workers)
+        while running:
+            item = await queue.get()
+            if item is done:
+                running -= 1
+                continue
+            source, lineno, key = item
+            if source is None:
+                raise key
+            yield item
+    finally:
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
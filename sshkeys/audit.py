@@ -0,0 +1,173 @@
+"""Parsing of many ``authorized_keys`` files across a process pool.
+
+Workers do not send back :class:`~sshkeys.Key` instances, but compact
+:class:`AuditRecord` tuples that are cheap to pickle."""
+
+import os
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from . import Key
+
+
+AUTHORIZED_KEYS_NAMES = ('authorized_keys', 'authorized_keys2')
+
+AuditRecord = namedtuple('AuditRecord', [
+    'path', 'lineno', 'type', 'length', 'fingerprint', 'options', 'error'])
+AuditRecord.__doc__ = """A single key (or error) found during an audit.
+
+``fingerprint`` is the OpenSSH-style SHA256 fingerprint and ``options`` a
+tuple of ``(name, value)`` pairs. For lines that failed to parse, only
+``path``, ``lineno`` and ``error`` are set; if the file could not be read at
+all, ``lineno`` is ``None`` as well."""
+
+
+class AuditStats(object):
+    """Counters collected while auditing."""
+
+    def __init__(self):
+        self.files = 0
+        self.lines = 0
+        self.errors = 0
+        self.elapsed = 0.0
+
+    @property
+    def files_per_second(self):
+        return self.files / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def lines_per_second(self):
+        return self.lines / self.elapsed if self.elapsed else 0.0
+
+    def __repr__(self):
+        return ('<AuditStats {0.files} files, {0.lines} lines, {0.errors} '
+                'errors in {0.elapsed:.3f}s>'.format(self))
+
+
+def find_authorized_keys(paths, names=AUTHORIZED_KEYS_NAMES):
+    """Yield the files to audit below ``paths``.
+
+    Paths naming a file are passed through, directories are walked
+    recursively for files whose name is in ``names``."""
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for fn in sorted(filenames):
+                if fn in names:
+                    yield os.path.join(dirpath, fn)
+
+
+def audit_file(path):
+    """Parse a single file, returning a list of :class:`AuditRecord`."""
+    records = []
+    try:
+        for lineno, key in Key.iter_pubkey_file(path, lazy=True):
+            if not isinstance(key, Key):
+                records.append(AuditRecord(path, lineno, None, None, None, (),
+                                           key.reason))
+                continue
+
+            try:
+                # lazily loaded keys decode their data here
+                fingerprint = key.fingerprint_key.get_readable_fingerprint(
+                    'sha256')
+            except ValueError as e:
+                records.append(AuditRecord(path, lineno, key.type, None, None,
+                                           (), getattr(e, 'reason', str(e))))
+                continue
+
+            try:
+                length = key.length
+            except (NotImplementedError, ValueError):
+                length = None
+
+            records.append(AuditRecord(path, lineno, key.type, length,
+                                       fingerprint,
+                                       tuple(key.options.items()), None))
+    except (IOError, OSError, UnicodeDecodeError) as e:
+        records.append(AuditRecord(path, None, None, None, None, (), str(e)))
+    return records
+
+
+def _audit_chunk(paths):
+    records = []
+    for path in paths:
+        records.extend(audit_file(path))
+    return len(paths), records
+
+
+def _chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _bounded_map(executor, fn, iterable, window):
+    # like executor.map, but only keeps window calls in flight, so that
+    # arguments are taken from iterable as results are consumed instead of
+    # all being submitted up front
+    iterable = iter(iterable)
+    pending = deque()
+    try:
+        for arg in iterable:
+            pending.append(executor.submit(fn, arg))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def audit(paths, workers=None, chunksize=64, stats=None,
+          names=AUTHORIZED_KEYS_NAMES):
+    """Audit all files found below ``paths`` (see
+    :func:`find_authorized_keys`), yielding an :class:`AuditRecord` for every
+    key line.
+
+    Files are handed to a pool of ``workers`` processes (defaulting to the
+    number of CPUs) in chunks of ``chunksize`` files, with at most two chunks
+    per worker in flight. With ``workers=1``, everything runs in the current
+    process. If an :class:`AuditStats`
+    instance is passed as ``stats``, it is updated as results come in."""
+    if stats is None:
+        stats = AuditStats()
+
+    start = time.time()
+    chunks = _chunked(find_authorized_keys(paths, names), chunksize)
+
+    executor = None
+    if workers == 1:
+        results = map(_audit_chunk, chunks)
+    else:
+        if workers is None:
+            workers = os.cpu_count() or 1
+        executor = ProcessPoolExecutor(workers)
+        results = _bounded_map(executor, _audit_chunk, chunks, workers * 2)
+
+    try:
+        for nfiles, records in results:
+            stats.files += nfiles
+            for record in records:
+                if record.lineno is not None:
+                    stats.lines += 1
+                if record.error is not None:
+                    stats.errors += 1
+                yield record
+            stats.elapsed = time.time() - start
+    finally:
+        if executor is not None:
+            results.close()
+            executor.shutdown()
+        stats.elapsed = time.time() - start
@@ -0,0 +1,133 @@
+"""Caching of parsed key files, for processes that read the same files over
+and over again (e.g. an ``AuthorizedKeysCommand``).
+
+Files are identified by device, inode, modification time and size. As long
+as these are unchanged, looking up a file costs a single ``stat`` call. When
+a file does change, only lines whose text is new are parsed again; the
+:class:`~sshkeys.Key` instances of all other lines are reused."""
+
+import os
+from collections import OrderedDict
+
+from . import Key, KeyParseError, _strip_line
+
+
+def _signature(st):
+    return st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size
+
+
+class _Entry(object):
+    __slots__ = ('signature', 'items', 'keys')
+
+    def __init__(self, signature, items, keys):
+        self.signature = signature
+        self.items = items
+        self.keys = keys
+
+    @property
+    def size(self):
+        return self.signature[3]
+
+
+class KeyFileCache(object):
+    """An LRU cache of parsed ``authorized_keys`` files.
+
+    At most ``max_entries`` files with a combined size of ``max_bytes`` are
+    kept. Since cached keys are handed out to every caller, they should be
+    treated as read-only.
+
+    ``hits``, ``misses`` and ``evictions`` count lookups, ``lines_parsed``
+    and ``lines_reused`` count the lines of changed files that had to be
+    parsed or could be taken from the previous version."""
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024,
+                 lazy=False):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lazy = lazy
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lines_parsed = 0
+        self.lines_reused = 0
+
+    def load(self, path):
+        """Return the contents of a file as a tuple of ``(lineno, key)``
+        pairs, as yielded by :meth:`Key.iter_pubkey_file`."""
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            # accounted as dropped before stat, which fails if the file is
+            # gone
+            self.bytes -= entry.size
+            if entry.signature == _signature(os.stat(path)):
+                self.hits += 1
+                self._entries[path] = entry
+                self.bytes += entry.size
+                return entry.items
+
+        self.misses += 1
+        entry = self._parse(path, entry.keys if entry is not None else {})
+        self._entries[path] = entry
+        self.bytes += entry.size
+        self._evict()
+        return entry.items
+
+    def _parse(self, path, previous):
+        items = []
+        keys = {}
+        with open(path, 'rb') as f:
+            signature = _signature(os.fstat(f.fileno()))
+            for lineno, line in enumerate(f, 1):
+                try:
+                    line = _strip_line(line)
+                except KeyParseError as e:
+                    e.lineno = lineno
+                    items.append((lineno, e))
+                    continue
+                if line is None:
+                    continue
+
+                key = previous.get(line)
+                if key is not None:
+                    self.lines_reused += 1
+                else:
+                    self.lines_parsed += 1
+                    try:
+                        key = Key.from_pubkey_line(line, self.lazy)
+                    except KeyParseError as e:
+                        e.lineno = lineno
+                        e.line = line
+                        items.append((lineno, e))
+                        continue
+
+                keys[line] = key
+                items.append((lineno, key))
+        return _Entry(signature, tuple(items), keys)
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or
+                                 self.bytes > self.max_bytes):
+            _, entry = self._entries.popitem(last=False)
+            self.bytes -= entry.size
+            self.evictions += 1
+
+    def invalidate(self, path):
+        """Drop a file from the cache."""
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self.bytes -= entry.size
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def __contains__(self, path):
+        return path in self._entries
+
+    def __len__(self):
+        return len(self._entries)
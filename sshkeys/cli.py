@@ -0,0 +1,297 @@
+"""Command line interface, available as ``python -m sshkeys`` and as the
+``sshkeys`` console script.
+
+Every invocation pays for interpreter startup and imports, which matters when
+running as ``AuthorizedKeysCommand`` on each SSH login. Only :mod:`argparse`
+and the core module are imported up front; everything else is imported by the
+subcommand that needs it."""
+
+import argparse
+import sys
+
+from . import Key, _format_options
+
+#: Default ``authorized_keys`` location for ``sshkeys authorized-keys``, with
+#: the same ``%h``, ``%u`` and ``%%`` tokens as ``AuthorizedKeysFile``.
+AUTHORIZED_KEYS_FILE = '%h/.ssh/authorized_keys'
+
+
+def _length(key):
+    try:
+        return str(key.length)
+    except NotImplementedError:
+        return '?'
+
+
+def _stdout():
+    # keys are written as UTF-8 regardless of the locale, so that no key
+    # can make a command fail halfway through its output
+    buf = getattr(sys.stdout, 'buffer', None)
+    if buf is None:
+        return sys.stdout
+    return _Utf8Writer(buf)
+
+
+class _Utf8Writer(object):
+    def __init__(self, buf):
+        self._buf = buf
+
+    def write(self, text):
+        self._buf.write(text.encode('utf-8', 'surrogateescape'))
+
+
+def _iter_entries(paths, lazy=False):
+    # yields (path, lineno, key or error) for all given files, reading
+    # stdin for '-' or if no files are given. Files are read as bytes, so
+    # lines that are not valid UTF-8 are reported like other bad lines
+    stdin = getattr(sys.stdin, 'buffer', sys.stdin)
+    for path in paths or ['-']:
+        if path == '-':
+            path, f = '(stdin)', stdin
+        else:
+            try:
+                f = open(path, 'rb')
+            except (IOError, OSError) as e:
+                yield path, None, e
+                continue
+
+        try:
+            for lineno, key in Key.iter_pubkey_file(f, lazy):
+                yield path, lineno, key
+        finally:
+            if f is not stdin:
+                f.close()
+
+
+def _report(path, lineno, error):
+    if lineno is None:
+        sys.stderr.write('sshkeys: %s\n' % error)
+    else:
+        sys.stderr.write('sshkeys: %s:%d: %s\n' % (path, lineno, error))
+
+
+def _iter_keys(entries, status):
+    # reports errors to stderr and yields (path, lineno, key) for keys only.
+    # status is a list whose only item is set to 1 on errors
+    for path, lineno, key in entries:
+        if isinstance(key, Key):
+            yield path, lineno, key
+        else:
+            status[0] = 1
+            _report(path, lineno, key)
+
+
+def _is_valid(path, lineno, key, status):
+    # base64 decoding skips invalid characters, so a key is only known to be
+    # valid once its components have been decoded
+    try:
+        key._decode()
+    except ValueError as e:
+        status[0] = 1
+        _report(path, lineno, e)
+        return False
+    return True
+
+
+def _key_filter(args):
+    if not (args.types or args.min_length or args.max_length or
+            args.fingerprints):
+        return None
+
+    from .query import KeyFilter
+    return KeyFilter(types=args.types,
+                     min_length=args.min_length,
+                     max_length=args.max_length,
+                     fingerprints=args.fingerprints)
+
+
+def cmd_fingerprint(args):
+    status = [0]
+    out = _stdout()
+    for path, lineno, key in _iter_keys(_iter_entries(args.files, lazy=True),
+                                        status):
+        if _is_valid(path, lineno, key, status):
+            fingerprint = key.fingerprint_key.get_readable_fingerprint(
+                args.hash)
+            out.write('%s %s %s (%s)\n' % (
+                _length(key), fingerprint, key.comment or 'no comment',
+                key.type))
+    return status[0]
+
+
+def cmd_list(args):
+    status = [0]
+    out = _stdout()
+    for path, lineno, key in _iter_keys(_iter_entries(args.files, lazy=True),
+                                        status):
+        if _is_valid(path, lineno, key, status):
+            out.write('\t'.join([
+                path, str(lineno), key.type, _length(key),
+                key.fingerprint_key.get_readable_fingerprint(args.hash),
+                _format_options(key.options.items()),
+                key.comment or '',
+            ]) + '\n')
+    return status[0]
+
+
+def cmd_filter(args):
+    status = [0]
+    match = _key_filter(args)
+    out = _stdout()
+    for path, lineno, key in _iter_keys(_iter_entries(args.files, lazy=True),
+                                        status):
+        if ((match is None or match(key)) and
+                _is_valid(path, lineno, key, status)):
+            out.write(key.to_pubkey_line() + '\n')
+    return status[0]
+
+
+def _expand_tokens(template, user, home):
+    return '%'.join(part.replace('%h', home).replace('%u', user)
+                    for part in template.split('%%'))
+
+
+def cmd_authorized_keys(args):
+    import pwd
+
+    try:
+        pw = pwd.getpwnam(args.user)
+    except KeyError:
+        sys.stderr.write('sshkeys: no such user: %s\n' % args.user)
+        return 1
+
+    path = _expand_tokens(args.file, pw.pw_name, pw.pw_dir)
+    try:
+        f = open(path, 'rb')
+    except (FileNotFoundError, NotADirectoryError) as e:
+        # no authorized_keys file simply means no keys
+        sys.stderr.write('sshkeys: %s\n' % e)
+        return 0
+    except OSError as e:
+        # e.g. a file the command user may not read: failing makes this
+        # show up in sshd's log instead of silently denying all keys
+        sys.stderr.write('sshkeys: %s\n' % e)
+        return 1
+
+    match = _key_filter(args)
+    out = _stdout()
+    # sshd ignores all output if the command fails, so malformed lines are
+    # reported but do not change the exit status
+    with f:
+        entries = ((path, lineno, key) for lineno, key
+                   in Key.iter_pubkey_file(f, lazy=True))
+        for path, lineno, key in _iter_keys(entries, [0]):
+            if ((match is None or match(key)) and
+                    _is_valid(path, lineno, key, [0])):
+                out.write(key.to_pubkey_line() + '\n')
+    return 0
+
+
+def cmd_audit(args):
+    from .audit import AuditStats, audit
+
+    stats = AuditStats()
+    out = _stdout()
+    for r in audit(args.paths, args.workers, args.chunksize, stats):
+        out.write('\t'.join([
+            r.path,
+            '' if r.lineno is None else str(r.lineno),
+            r.type or '',
+            '' if r.length is None else str(r.length),
+            r.fingerprint or '',
+            _format_options(r.options),
+            r.error or '',
+        ]) + '\n')
+
+    sys.stderr.write(
+        'audited {0.files} files, {0.lines} lines ({0.errors} errors) in '
+        '{0.elapsed:.2f}s: {0.files_per_second:.0f} files/s, '
+        '{0.lines_per_second:.0f} lines/s\n'.format(stats))
+    return 0
+
+
+def _add_files(p):
+    p.add_argument('files', nargs='*', metavar='FILE',
+                   help="files in authorized_keys format ('-' or none for "
+                        "stdin)")
+
+
+def _add_hash(p):
+    p.add_argument('-E', dest='hash', default='sha256',
+                   choices=['md5', 'sha1', 'sha256'],
+                   help='fingerprint hash algorithm (default: sha256)')
+
+
+def _add_filters(p):
+    p.add_argument('-t', '--type', dest='types', action='append',
+                   metavar='TYPE', help='only keys of this type (repeatable)')
+    p.add_argument('--min-length', type=int, metavar='BITS')
+    p.add_argument('--max-length', type=int, metavar='BITS')
+    p.add_argument('--fingerprint', dest='fingerprints', action='append',
+                   metavar='FP',
+                   help='only keys with this fingerprint, e.g. SHA256:... '
+                        '(repeatable)')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='sshkeys', description='Work with public SSH keys.')
+    commands = parser.add_subparsers(dest='command')
+
+    p = commands.add_parser(
+        'fingerprint', help='show key fingerprints',
+        description='Print length, fingerprint, comment and type of every '
+                    'key, like ssh-keygen -l.')
+    _add_hash(p)
+    _add_files(p)
+    p.set_defaults(func=cmd_fingerprint)
+
+    p = commands.add_parser(
+        'list', help='list keys with their options',
+        description='Print one tab-separated line per key: file, line '
+                    'number, type, length, fingerprint, options and '
+                    'comment.')
+    _add_hash(p)
+    _add_files(p)
+    p.set_defaults(func=cmd_list)
+
+    p = commands.add_parser(
+        'filter', help='print keys matching criteria',
+        description='Print the lines of all keys matching every given '
+                    'criterion. Malformed lines are reported on stderr.')
+    _add_filters(p)
+    _add_files(p)
+    p.set_defaults(func=cmd_filter)
+
+    p = commands.add_parser(
+        'authorized-keys', help='print the authorized keys of a user',
+        description='Print the valid keys from the authorized_keys file of '
+                    'USER, for use as sshd AuthorizedKeysCommand (e.g. '
+                    '"sshkeys authorized-keys %%u"). Malformed lines are '
+                    'skipped. Fails if the file exists but cannot be read, '
+                    'so AuthorizedKeysCommandUser must be able to read it.')
+    p.add_argument('user', metavar='USER')
+    p.add_argument('-f', '--file', default=AUTHORIZED_KEYS_FILE,
+                   help='file to read; %%h, %%u and %%%% are expanded like '
+                        'in AuthorizedKeysFile (default: %(default)s)')
+    _add_filters(p)
+    p.set_defaults(func=cmd_authorized_keys)
+
+    p = commands.add_parser(
+        'audit', help='parse authorized_keys files in parallel',
+        description='Parse all authorized_keys files below the given paths '
+                    'and print one tab-separated line per key: path, line '
+                    'number, type, length, SHA256 fingerprint, options and '
+                    'error.')
+    p.add_argument('paths', nargs='+', metavar='PATH')
+    p.add_argument('-j', '--workers', type=int, default=None,
+                   help='number of worker processes (default: CPU count)')
+    p.add_argument('--chunksize', type=int, default=64,
+                   help='number of files handed to a worker at once')
+    p.set_defaults(func=cmd_audit)
+
+    args = parser.parse_args(argv)
+    if not hasattr(args, 'func'):
+        parser.print_help()
+        return 2
+    return args.func(args)
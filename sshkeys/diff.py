@@ -0,0 +1,301 @@
+"""Comparing and reconciling two sets of keys.
+
+Entries are matched by their key data, so reordering a file, reordering the
+options of a key or changing its comment does not turn a key into a removal
+and an addition. Only one side is held in memory: :func:`diff` and
+:func:`merge` index the smaller side in a dictionary and stream the other one
+past it, so reconciling a large file with a small set of desired keys needs
+memory proportional to the small set only."""
+
+import os
+from collections import deque, namedtuple
+
+from . import Key, KeyParseError, write_pubkey_file
+
+ADDED = 'added'
+REMOVED = 'removed'
+CHANGED = 'changed'
+UNCHANGED = 'unchanged'
+
+Change = namedtuple('Change', ['action', 'old', 'new', 'old_lineno',
+                               'new_lineno', 'fields'])
+Change.__doc__ = """A difference between two sets of keys.
+
+``action`` is one of :data:`ADDED`, :data:`REMOVED`, :data:`CHANGED` or
+:data:`UNCHANGED`. ``old`` and ``new`` are the matching keys of both sides
+(``None`` for the missing side of additions and removals), with their line
+numbers if known. ``fields`` is a tuple of the names of the changed
+attributes, ``'options'`` and/or ``'comment'``."""
+
+_MISSING = object()
+
+
+def _same_options(a, b):
+    # options are compared by name and value, ignoring their order
+    if len(a) != len(b):
+        return False
+    for name, value in a.items():
+        if b.get(name, _MISSING) != value:
+            return False
+    return True
+
+
+def changed_fields(old, new):
+    """Return a tuple of the names of the attributes that differ between two
+    keys with the same data: ``'options'`` and/or ``'comment'``. The order of
+    options is not significant."""
+    fields = ()
+    if not _same_options(old.options, new.options):
+        fields += ('options',)
+    if old.comment != new.comment:
+        fields += ('comment',)
+    return fields
+
+
+def _size(source):
+    # returns (in_memory, size) used to pick the side to index; in-memory
+    # sequences are cheapest to index since their keys already exist
+    if hasattr(source, '__len__') and not isinstance(source, str):
+        return True, len(source)
+    try:
+        if isinstance(source, str):
+            return False, os.path.getsize(source)
+        if hasattr(source, 'fileno'):
+            return False, os.fstat(source.fileno()).st_size
+    except (OSError, ValueError):
+        pass
+    return False, None
+
+
+def _choose_index(old, new):
+    old_mem, old_size = _size(old)
+    new_mem, new_size = _size(new)
+    if old_mem != new_mem:
+        return 'old' if old_mem else 'new'
+    if old_size is not None and new_size is not None:
+        return 'old' if old_size < new_size else 'new'
+    return 'old' if new_size is None and old_size is not None else 'new'
+
+
+def _iter_file(file, lazy=False):
+    # like Key.iter_pubkey_file, but also yields (lineno, line) for comments
+    # and blank lines, with the line as a string without its line break.
+    # Lines are handed to iter_pubkey_lines one at a time, so the comments
+    # skipped by it are known before the entry following them is yielded
+    if not hasattr(file, 'read'):
+        with open(file, 'rb') as f:
+            for item in _iter_file(f, lazy):
+                yield item
+        return
+
+    skipped = deque()
+
+    def lines():
+        for lineno, line in enumerate(file, 1):
+            stripped = line.strip()
+            if not stripped or stripped[:1] in ('#', b'#'):
+                if isinstance(line, bytes):
+                    line = line.decode('utf-8', 'surrogateescape')
+                skipped.append((lineno, line.rstrip('\r\n')))
+            yield line
+
+    for lineno, key in Key.iter_pubkey_lines(lines(), lazy):
+        while skipped and skipped[0][0] < lineno:
+            yield skipped.popleft()
+        yield lineno, key
+    while skipped:
+        yield skipped.popleft()
+
+
+def _parse_string(line, lineno, lazy):
+    # strings of in-memory sources are lines: comments and blank lines are
+    # returned as they are (without line break), anything else is parsed
+    stripped = line.strip()
+    if not stripped or stripped.startswith('#'):
+        return line.rstrip('\r\n')
+    try:
+        return Key.from_pubkey_line(stripped, lazy)
+    except KeyParseError as e:
+        e.lineno = lineno
+        e.line = stripped
+        return e
+
+
+def _iter_items(source, lazy):
+    for item in source:
+        lineno, key = (None, item) if not isinstance(item, tuple) else item
+        if isinstance(key, str):
+            key = _parse_string(key, lineno, lazy)
+        yield lineno, key
+
+
+def _iter_entries(source, lazy=False, comments=False):
+    # normalizes filenames, file objects and iterables of keys, lines or
+    # (lineno, key) tuples to (lineno, key or error or string) tuples, with
+    # strings for comments and blank lines. Files only yield these if
+    # comments is true
+    if isinstance(source, str) or hasattr(source, 'read'):
+        if comments:
+            return _iter_file(source, lazy)
+        return Key.iter_pubkey_file(source, lazy)
+    return _iter_items(source, lazy)
+
+
+def _iter_data(source, comments=False):
+    # yields (data, lineno, key) for keys, (None, lineno, error) for entries
+    # that failed to parse or whose data cannot be decoded and, if comments
+    # is true, (None, lineno, line) for comments and blank lines
+    for lineno, key in _iter_entries(source, comments=comments):
+        if isinstance(key, str):
+            if comments:
+                yield None, lineno, key
+            continue
+        if isinstance(key, Key):
+            try:
+                yield key.data, lineno, key
+                continue
+            except ValueError as e:
+                key = KeyParseError('Invalid key data', str(e), lineno,
+                                    key.to_pubkey_line())
+        yield None, lineno, key
+
+
+def _match(old, new, index, comments=False):
+    # yields (old_lineno, old_key, new_lineno, new_key) with one side None
+    # for unmatched entries: first in the order of the streamed side, then
+    # the remaining entries of the indexed side in their original order.
+    # Keys with the same data are matched pairwise in order; errors and the
+    # comments of old, included if comments is true, are never matched
+    if index is None:
+        index = _choose_index(old, new)
+    if index == 'old':
+        indexed, streamed = old, new
+    elif index == 'new':
+        indexed, streamed = new, old
+    else:
+        raise ValueError('index must be "old", "new" or None')
+
+    flip = index == 'new'
+    unmatched = (None, None)
+
+    table = {}
+    order = []
+    for data, lineno, key in _iter_data(indexed, comments and not flip):
+        entry = (lineno, key)
+        order.append((data, entry))
+        if data is not None:
+            table.setdefault(data, []).append(entry)
+
+    get = table.get
+    for data, lineno, key in _iter_data(streamed, comments and flip):
+        candidates = get(data)
+        other = candidates.pop(0) if candidates else unmatched
+        yield (lineno, key) + other if flip else other + (lineno, key)
+
+    # matched entries were taken from the front of their candidate lists, so
+    # the unmatched ones are found in their original order
+    for data, entry in order:
+        if data is not None:
+            candidates = table[data]
+            if not candidates or candidates[0] is not entry:
+                continue
+            candidates.pop(0)
+        yield unmatched + entry if flip else entry + unmatched
+
+
+def diff(old, new, include_unchanged=False, index=None, errors=None):
+    """Compare two sets of keys, yielding a :class:`Change` for every key
+    that was added, removed or changed.
+
+    ``old`` and ``new`` may be filenames, file objects in ``authorized_keys``
+    format, iterables of keys, of lines in that format or of the ``(lineno,
+    key)`` tuples produced by :meth:`Key.iter_pubkey_file`. Files are read
+    line by line.
+
+    One side is indexed and the other streamed: changes are yielded in the
+    order of the streamed side, followed by the unmatched keys of the indexed
+    side. ``index`` (``'old'`` or ``'new'``) picks the indexed side; by
+    default, in-memory sequences are preferred over files and the smaller one
+    is chosen. Keys occurring more than once are matched pairwise.
+
+    Unchanged keys are only reported if ``include_unchanged`` is true.
+    Entries that failed to parse are skipped and appended to ``errors`` if it
+    is a list."""
+    for old_lineno, old_key, new_lineno, new_key in _match(old, new, index):
+        if isinstance(old_key, KeyParseError):
+            if errors is not None:
+                errors.append(old_key)
+        elif isinstance(new_key, KeyParseError):
+            if errors is not None:
+                errors.append(new_key)
+        elif old_key is None:
+            yield Change(ADDED, None, new_key, None, new_lineno, ())
+        elif new_key is None:
+            yield Change(REMOVED, old_key, None, old_lineno, None, ())
+        else:
+            fields = changed_fields(old_key, new_key)
+            if fields:
+                yield Change(CHANGED, old_key, new_key, old_lineno,
+                             new_lineno, fields)
+            elif include_unchanged:
+                yield Change(UNCHANGED, old_key, new_key, old_lineno,
+                             new_lineno, ())
+
+
+def merge(current, desired, remove=True, update=True, index=None,
+          errors=None):
+    """Reconcile ``current`` with ``desired``, yielding the resulting keys.
+
+    Keys present on both sides are yielded once: as found in ``current`` if
+    they are unchanged (so they are written back verbatim), otherwise as in
+    ``desired`` if ``update`` is true. Keys only in ``desired`` are added;
+    keys only in ``current`` are dropped if ``remove`` is true, in which case
+    the result equals ``desired`` up to order.
+
+    ``index`` is ``'current'``, ``'desired'`` or ``None`` to choose like
+    :func:`diff` does. The other side is streamed and determines the order of
+    the result; unmatched keys of the indexed side follow at the end. The
+    other arguments are as for :func:`diff`. If ``remove`` is false, lines of
+    ``current`` that failed to parse are kept as ``(lineno, error)`` tuples,
+    otherwise they are dropped. Comments and blank lines of ``current`` are
+    always kept, as strings: in place if ``current`` is streamed, otherwise
+    after its unmatched keys.
+
+    The result can be passed to :func:`~sshkeys.write_pubkey_file`, see
+    :func:`merge_file`."""
+    if index is not None:
+        try:
+            index = {'current': 'old', 'desired': 'new'}[index]
+        except KeyError:
+            raise ValueError('index must be "current", "desired" or None')
+
+    for old_lineno, old_key, new_lineno, new_key in _match(current, desired,
+                                                           index, True):
+        if isinstance(old_key, str):
+            yield old_key
+        elif isinstance(old_key, KeyParseError):
+            if errors is not None:
+                errors.append(old_key)
+            if not remove:
+                yield old_lineno, old_key
+        elif isinstance(new_key, KeyParseError):
+            if errors is not None:
+                errors.append(new_key)
+        elif old_key is None:
+            yield new_key
+        elif new_key is None:
+            if not remove:
+                yield old_key
+        elif update and changed_fields(old_key, new_key):
+            yield new_key
+        else:
+            yield old_key
+
+
+def merge_file(file, desired, remove=True, update=True, errors=None):
+    """Apply :func:`merge` to the ``authorized_keys`` file ``file`` in a
+    single pass, atomically replacing it (see
+    :func:`~sshkeys.write_pubkey_file`). Returns the number of lines
+    written."""
+    return write_pubkey_file(merge(file, desired, remove, update,
+                                   errors=errors), file, atomic=True)
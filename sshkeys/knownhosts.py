@@ -0,0 +1,230 @@
+"""Parsing of and host lookups in ``known_hosts`` files.
+
+:class:`KnownHosts` indexes entries so that looking up a host does not scan
+the whole file: plain host names are dictionary lookups, wildcard patterns
+are matched with precompiled regular expressions and hashed host names
+(``|1|salt|hash``) are checked with one keyed HMAC-SHA1 per distinct salt.
+Results for hashed names are cached per host."""
+
+import binascii
+import hmac
+import re
+from base64 import b64decode
+from collections import namedtuple
+from hashlib import sha1
+
+from . import Key, KeyParseError, _strip_line
+
+MARKERS = ('@cert-authority', '@revoked')
+
+HASH_MAGIC = '|1|'
+
+KnownHostsEntry = namedtuple('KnownHostsEntry',
+                             ['marker', 'patterns', 'key', 'lineno'])
+KnownHostsEntry.__doc__ = """A single line of a ``known_hosts`` file.
+
+``marker`` is ``None``, ``'@cert-authority'`` or ``'@revoked'``,
+``patterns`` the tuple of host patterns (or hashed host names) as found in
+the file and ``key`` the parsed :class:`~sshkeys.Key`."""
+
+
+def host_name(host, port=22):
+    """Return the name ``host`` is stored under in ``known_hosts`` when
+    connecting on ``port``."""
+    host = host.lower()
+    if port == 22:
+        return host
+    return '[{}]:{}'.format(host, port)
+
+
+def parse_known_hosts_line(line, lineno=None):
+    """Parse a single (non-empty, non-comment) line. Raises
+    :class:`~sshkeys.KeyParseError` if the line is malformed."""
+    marker = None
+    fields = line.split(None, 1)
+    if fields and fields[0].startswith('@'):
+        marker = fields[0]
+        if marker not in MARKERS:
+            raise KeyParseError('Unknown marker', marker)
+        fields = fields[1].split(None, 1) if len(fields) > 1 else []
+
+    if len(fields) < 2:
+        raise KeyParseError('Key has insufficient number of fields')
+
+    key = Key.from_pubkey_line(fields[1])
+    if key.options:
+        raise KeyParseError('Unexpected options')
+    return KnownHostsEntry(marker, tuple(fields[0].split(',')), key, lineno)
+
+
+def iter_known_hosts(file):
+    """Iterate over the entries in a ``known_hosts`` file, which may be given
+    as a filename or file-like object. Like
+    :meth:`~sshkeys.Key.iter_pubkey_file`, yields ``(lineno, entry)`` tuples,
+    with a :class:`~sshkeys.KeyParseError` in place of the entry for
+    malformed lines and lines that are not valid UTF-8."""
+    if not hasattr(file, 'read'):
+        with open(file, 'rb') as f:
+            for item in iter_known_hosts(f):
+                yield item
+        return
+
+    for lineno, line in enumerate(file, 1):
+        try:
+            line = _strip_line(line)
+        except KeyParseError as e:
+            e.lineno = lineno
+            yield lineno, e
+            continue
+        if line is None:
+            continue
+
+        try:
+            yield lineno, parse_known_hosts_line(line, lineno)
+        except KeyParseError as e:
+            e.lineno = lineno
+            e.line = line
+            yield lineno, e
+
+
+_WILDCARDS = {'*': '.*', '?': '.'}
+
+
+def _compile_pattern(pattern):
+    # only * and ? are special, as in OpenSSH's match_pattern(); brackets
+    # are literal, since they enclose host names with a port
+    regex = ''.join(_WILDCARDS.get(c) or re.escape(c) for c in pattern)
+    return re.compile(regex + r'\Z', re.IGNORECASE | re.DOTALL).match
+
+
+class KnownHosts(object):
+    """An index of ``known_hosts`` entries by host.
+
+    Host patterns follow OpenSSH: ``*`` and ``?`` are wildcards, and an entry
+    does not match a host if any of its patterns prefixed with ``!`` does.
+    ``cache_size`` limits the number of hosts whose hashed-name lookups are
+    cached."""
+
+    def __init__(self, entries=(), cache_size=4096):
+        self._plain = {}
+        self._wildcards = []
+        self._hashed = {}
+        self._negations = {}
+        self._positions = {}
+        self._revoked = set()
+        self._cache = {}
+        self.cache_size = cache_size
+        self.entries = []
+        self.errors = []
+
+        for entry in entries:
+            self.add(entry)
+
+    @classmethod
+    def from_file(cls, file):
+        """Build an index from a ``known_hosts`` file. Parse errors are
+        collected in the ``errors`` attribute of the result."""
+        known_hosts = cls()
+        for lineno, entry in iter_known_hosts(file):
+            if isinstance(entry, KeyParseError):
+                known_hosts.errors.append(entry)
+            else:
+                known_hosts.add(entry)
+        return known_hosts
+
+    def add(self, entry):
+        self._positions[id(entry)] = len(self.entries)
+        self.entries.append(entry)
+        if entry.marker == '@revoked':
+            self._revoked.add(entry.key)
+
+        negations = []
+        for pattern in entry.patterns:
+            if pattern.startswith(HASH_MAGIC):
+                self._add_hashed(pattern, entry)
+            elif pattern.startswith('!'):
+                negations.append(_compile_pattern(pattern[1:]))
+            elif '*' in pattern or '?' in pattern:
+                self._wildcards.append((_compile_pattern(pattern), entry))
+            else:
+                self._plain.setdefault(pattern.lower(), []).append(entry)
+
+        if negations:
+            self._negations[id(entry)] = negations
+
+    def _add_hashed(self, pattern, entry):
+        try:
+            salt64, hash64 = pattern[len(HASH_MAGIC):].split('|')
+            salt, digest = b64decode(salt64), b64decode(hash64)
+        except (ValueError, binascii.Error):
+            return  # never matches, like in OpenSSH
+
+        group = self._hashed.get(salt)
+        if group is None:
+            # keeps the keyed HMAC state, so that every lookup only hashes
+            # the host name itself
+            group = self._hashed[salt] = (hmac.new(salt, digestmod=sha1), {})
+        group[1].setdefault(digest, []).append(entry)
+        self._cache.clear()
+
+    def _lookup_hashed(self, name):
+        found = self._cache.get(name)
+        if found is None:
+            found = []
+            encoded = name.encode('utf-8')
+            for mac, digests in self._hashed.values():
+                mac = mac.copy()
+                mac.update(encoded)
+                found.extend(digests.get(mac.digest(), ()))
+
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            self._cache[name] = found
+        return found
+
+    def lookup(self, host, port=22):
+        """Return all entries matching ``host`` on ``port``, in file
+        order."""
+        name = host_name(host, port)
+
+        candidates = list(self._plain.get(name, ()))
+        for match, entry in self._wildcards:
+            if match(name):
+                candidates.append(entry)
+        if self._hashed:
+            candidates.extend(self._lookup_hashed(name))
+
+        result = {}
+        for entry in candidates:
+            negations = self._negations.get(id(entry))
+            if negations and any(match(name) for match in negations):
+                continue
+            result[self._positions[id(entry)]] = entry
+
+        return [result[pos] for pos in sorted(result)]
+
+    def keys_for(self, host, port=22):
+        """Return the host keys accepted for ``host``, excluding certificate
+        authorities and revoked keys."""
+        entries = self.lookup(host, port)
+        revoked = set(e.key for e in entries if e.marker == '@revoked')
+        return [e.key for e in entries
+                if e.marker is None and e.key not in revoked]
+
+    def authorities_for(self, host, port=22):
+        """Return the certificate authority keys trusted for ``host``."""
+        return [e.key for e in self.lookup(host, port)
+                if e.marker == '@cert-authority']
+
+    def is_revoked(self, key, host=None, port=22):
+        """Check whether ``key`` is marked as revoked. If ``host`` is given,
+        only revocations whose patterns match ``host`` are considered."""
+        if key not in self._revoked:
+            return False
+        if host is None:
+            return True
+        return any(e.marker == '@revoked' and e.key == key
+                   for e in self.lookup(host, port))
+
+    def __len__(self):
+        return len(self.entries)
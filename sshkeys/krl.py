@@ -0,0 +1,329 @@
+"""Key revocation lists.
+
+:class:`RevocationList` loads OpenSSH Key Revocation Lists (the binary format
+written by ``ssh-keygen -k``, see ``PROTOCOL.krl`` in the OpenSSH sources) as
+well as plain revoked keys files with one public key per line, both accepted
+by sshd's ``RevokedKeys`` option. Revoked keys and fingerprints are kept in
+sets of digests and revoked certificate serials in sorted intervals per CA,
+so checking a key costs a few hash lookups and a binary search, regardless
+of the size of the list."""
+
+import io
+import re
+from bisect import bisect_right
+
+from . import (_UINT32, _UINT64, CertificateKey, Key, KeyParseError,
+               _read_uint, iter_prefixed, parse_fingerprint, read_prefixed)
+
+KRL_MAGIC = b'SSHKRL\n\0'
+KRL_FORMAT_VERSION = 1
+
+# section types
+_SECTION_CERTIFICATES = 1
+_SECTION_EXPLICIT_KEY = 2
+_SECTION_FINGERPRINT_SHA1 = 3
+_SECTION_SIGNATURE = 4
+_SECTION_FINGERPRINT_SHA256 = 5
+
+# certificate subsection types
+_CERT_SERIAL_LIST = 0x20
+_CERT_SERIAL_RANGE = 0x21
+_CERT_SERIAL_BITMAP = 0x22
+_CERT_KEY_ID = 0x23
+
+_BIT_RUNS = re.compile('1+')
+
+
+def _read_byte(data, offset):
+    if offset >= len(data):
+        raise ValueError('Truncated section type at offset {}'.format(offset))
+    return data[offset], offset + 1
+
+
+def _iter_sections(data, offset=0):
+    # iterates over (type, data) of the sections following offset
+    end = len(data)
+    while offset < end:
+        section_type, offset = _read_byte(data, offset)
+        section, offset = read_prefixed(data, offset, copy=False)
+        yield section_type, section
+
+
+def _key_from_data(data):
+    # keys of unknown types can still be revoked by digest
+    key_type = read_prefixed(data)[0].decode('ascii', 'replace')
+    try:
+        return Key._class_for_type(key_type)(data)
+    except KeyParseError:
+        return Key(data)
+
+
+class _Serials(object):
+    # revoked serials and key ids of a single CA. Serials are kept as sorted,
+    # non-overlapping intervals in two parallel lists, merged on first lookup
+    __slots__ = ('_ranges', '_lows', '_highs', 'key_ids')
+
+    def __init__(self):
+        self._ranges = []
+        self._lows = None
+        self._highs = None
+        self.key_ids = set()
+
+    def add(self, low, high):
+        if self._lows is not None:
+            self._ranges = list(zip(self._lows, self._highs))
+            self._lows = self._highs = None
+        self._ranges.append((low, high))
+
+    def _build(self):
+        lows, highs = [], []
+        for low, high in sorted(self._ranges):
+            if highs and low <= highs[-1] + 1:
+                highs[-1] = max(highs[-1], high)
+            else:
+                lows.append(low)
+                highs.append(high)
+        self._lows, self._highs = lows, highs
+        self._ranges = None
+
+    def __contains__(self, serial):
+        if self._lows is None:
+            self._build()
+        i = bisect_right(self._lows, serial) - 1
+        return i >= 0 and serial <= self._highs[i]
+
+    def intervals(self):
+        if self._lows is None:
+            self._build()
+        return list(zip(self._lows, self._highs))
+
+
+class RevocationList(object):
+    """A set of revoked keys, fingerprints and certificates.
+
+    Certificates can be revoked by serial number or key id, either for a
+    specific CA (given as :class:`~sshkeys.Key` or key data) or, with ``ca``
+    being ``None``, for any CA. Signatures of KRLs are collected in
+    :attr:`signatures`, but not verified."""
+
+    def __init__(self):
+        #: KRL version number, as set with ``ssh-keygen -z``.
+        self.version = 0
+        #: Time the KRL was generated (seconds since the epoch).
+        self.generated = 0
+        self.comment = ''
+        #: List of ``(signing key data, signature)`` tuples.
+        self.signatures = []
+        self.errors = []
+        self._keys = set()
+        self._sha1 = set()
+        self._sha256 = set()
+        self._certs = {}
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Parse a binary KRL. Raises ``ValueError`` if the data is
+        malformed."""
+        krl = cls()
+        krl.load_krl(data)
+        return krl
+
+    @classmethod
+    def from_file(cls, file):
+        """Load a KRL or a plain revoked keys file, telling them apart by the
+        KRL magic. ``file`` may be a filename or a binary file-like object.
+
+        Parse errors of plain files are collected in :attr:`errors`;
+        malformed KRLs raise ``ValueError``."""
+        if not hasattr(file, 'read'):
+            with open(file, 'rb') as f:
+                return cls.from_file(f)
+
+        data = file.read()
+        if data.startswith(KRL_MAGIC):
+            return cls.from_bytes(data)
+
+        krl = cls()
+        lines = io.StringIO(data.decode('utf-8', 'replace'))
+        for lineno, key in Key.iter_pubkey_file(lines):
+            if isinstance(key, KeyParseError):
+                krl.errors.append(key)
+            else:
+                krl.revoke_key(key)
+        return krl
+
+    def load_krl(self, data):
+        """Add the revocations of a binary KRL."""
+        data = memoryview(data)
+        if bytes(data[:len(KRL_MAGIC)]) != KRL_MAGIC:
+            raise ValueError('Not a KRL (bad magic)')
+
+        offset = len(KRL_MAGIC)
+        fmt, offset = _read_uint(data, offset, _UINT32)
+        if fmt != KRL_FORMAT_VERSION:
+            raise ValueError('Unsupported KRL format version {}'.format(fmt))
+        self.version, offset = _read_uint(data, offset, _UINT64)
+        self.generated, offset = _read_uint(data, offset, _UINT64)
+        offset = _read_uint(data, offset, _UINT64)[1]  # flags
+        offset = read_prefixed(data, offset, copy=False)[1]  # reserved
+        comment, offset = read_prefixed(data, offset)
+        self.comment = comment.decode('utf-8', 'replace')
+
+        end = len(data)
+        signed = False
+        while offset < end:
+            section_type, offset = _read_byte(data, offset)
+            if section_type == _SECTION_SIGNATURE:
+                # unlike the other sections, signatures are two strings not
+                # wrapped in an outer one
+                signing_key, offset = read_prefixed(data, offset)
+                signature, offset = read_prefixed(data, offset)
+                self.signatures.append((signing_key, signature))
+                signed = True
+                continue
+            if signed:
+                raise ValueError('KRL section {} follows a signature'
+                                 .format(section_type))
+
+            section, offset = read_prefixed(data, offset, copy=False)
+            if section_type == _SECTION_CERTIFICATES:
+                self._load_certificates(section)
+            elif section_type == _SECTION_EXPLICIT_KEY:
+                for blob in iter_prefixed(section):
+                    self.revoke_key(blob)
+            elif section_type == _SECTION_FINGERPRINT_SHA1:
+                self._sha1.update(iter_prefixed(section))
+            elif section_type == _SECTION_FINGERPRINT_SHA256:
+                self._sha256.update(iter_prefixed(section))
+            else:
+                raise ValueError('Unknown KRL section type {}'
+                                 .format(section_type))
+
+    def _load_certificates(self, section):
+        ca, offset = read_prefixed(section)
+        offset = read_prefixed(section, offset, copy=False)[1]  # reserved
+        serials = self._serials(ca or None)
+
+        for sub_type, sub in _iter_sections(section, offset):
+            if sub_type == _CERT_SERIAL_LIST:
+                if len(sub) % _UINT64.size:
+                    raise ValueError('Truncated serial list')
+                for serial, in _UINT64.iter_unpack(sub):
+                    serials.add(serial, serial)
+            elif sub_type == _CERT_SERIAL_RANGE:
+                low, sub_offset = _read_uint(sub, 0, _UINT64)
+                serials.add(low, _read_uint(sub, sub_offset, _UINT64)[0])
+            elif sub_type == _CERT_SERIAL_BITMAP:
+                base, sub_offset = _read_uint(sub, 0, _UINT64)
+                bitmap = int.from_bytes(read_prefixed(sub, sub_offset)[0],
+                                        'big')
+                # runs of set bits, least significant bit first
+                bits = bin(bitmap)[:1:-1]
+                for run in _BIT_RUNS.finditer(bits):
+                    serials.add(base + run.start(), base + run.end() - 1)
+            elif sub_type == _CERT_KEY_ID:
+                serials.key_ids.update(key_id.decode('utf-8', 'replace')
+                                       for key_id in iter_prefixed(sub))
+            else:
+                raise ValueError('Unknown KRL certificate section type {}'
+                                 .format(sub_type))
+
+    def _serials(self, ca):
+        if isinstance(ca, Key):
+            ca = ca.data
+        elif ca is not None:
+            ca = bytes(ca)
+        serials = self._certs.get(ca)
+        if serials is None:
+            serials = self._certs[ca] = _Serials()
+        return serials
+
+    def revoke_key(self, key):
+        """Revoke a key, given as :class:`~sshkeys.Key` or key data. For
+        certificates, the certified key is revoked."""
+        if not isinstance(key, Key):
+            key = _key_from_data(bytes(key))
+        self._keys.add(key.fingerprint_key.get_fingerprint('sha256'))
+
+    def revoke_fingerprint(self, fingerprint, alg='sha256'):
+        """Revoke a key by fingerprint, either formatted (``'SHA256:...'``)
+        or as raw digest using ``alg`` (``'sha1'`` or ``'sha256'``)."""
+        if not isinstance(fingerprint, bytes):
+            alg, fingerprint = parse_fingerprint(fingerprint)
+        if alg == 'sha1':
+            self._sha1.add(fingerprint)
+        elif alg == 'sha256':
+            self._sha256.add(fingerprint)
+        else:
+            raise ValueError('Cannot revoke {} fingerprints'.format(alg))
+
+    def revoke_serials(self, low, high=None, ca=None):
+        """Revoke certificates with serial numbers from ``low`` to ``high``
+        (inclusive) issued by ``ca``."""
+        self._serials(ca).add(low, low if high is None else high)
+
+    def revoke_key_id(self, key_id, ca=None):
+        """Revoke certificates with key id ``key_id`` issued by ``ca``."""
+        self._serials(ca).key_ids.add(key_id)
+
+    def revoked_serials(self, ca=None):
+        """Return the sorted list of revoked ``(low, high)`` serial intervals
+        for ``ca``."""
+        serials = self._certs.get(ca.data if isinstance(ca, Key) else ca)
+        return serials.intervals() if serials is not None else []
+
+    def _is_key_revoked(self, key):
+        # checks the plain key by digest; fingerprints are computed from
+        # the certified key for certificates, as OpenSSH does
+        key = key.fingerprint_key
+        sha256 = key.get_fingerprint('sha256')
+        if sha256 in self._keys or sha256 in self._sha256:
+            return True
+        return bool(self._sha1) and key.get_fingerprint('sha1') in self._sha1
+
+    def _is_cert_revoked(self, cert):
+        serial = cert.serial
+        key_id = cert.key_id
+        for ca in (cert.signature_key, None):
+            serials = self._certs.get(ca)
+            if serials is None:
+                continue
+            # serial 0 means no serial
+            if (serial and serial in serials) or key_id in serials.key_ids:
+                return True
+        return False
+
+    def is_revoked(self, key):
+        """Return whether ``key`` is revoked. Certificates are revoked if
+        the certified key, the CA key, their serial or their key id is
+        revoked. Raises ``ValueError`` if the key data is malformed."""
+        if self._is_key_revoked(key):
+            return True
+        if isinstance(key, CertificateKey):
+            return (self._is_cert_revoked(key) or
+                    self._is_key_revoked(_key_from_data(key.signature_key)))
+        return False
+
+    def __contains__(self, key):
+        return self.is_revoked(key)
+
+    def filter(self, entries):
+        """Yield the items of ``entries`` that are not revoked. ``entries``
+        may hold keys or the ``(lineno, key)`` tuples produced by
+        :meth:`Key.iter_pubkey_file`; parse errors and keys with malformed
+        data are dropped."""
+        for entry in entries:
+            key = entry[1] if isinstance(entry, tuple) else entry
+            if not isinstance(key, Key):
+                continue
+            try:
+                if self.is_revoked(key):
+                    continue
+            except ValueError:
+                continue
+            yield entry
+
+    def filter_file(self, file):
+        """Yield the ``(lineno, key)`` tuples of a file whose keys are not
+        revoked."""
+        return self.filter(Key.iter_pubkey_file(file, lazy=True))
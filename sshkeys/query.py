@@ -0,0 +1,138 @@
+"""Filtering of large key sets.
+
+A :class:`KeyFilter` turns a set of criteria into a list of checks that is
+run in order of increasing cost: key type and options are known right after
+parsing, while fingerprints and lengths need the key data to be decoded. On
+lazily parsed keys (see :meth:`Key.from_pubkey_line`), keys rejected by a
+cheap check are never decoded at all."""
+
+import re
+
+from . import Key, parse_fingerprint
+
+
+class KeyFilter(object):
+    """A predicate over keys, matching if all given criteria match.
+
+    :param types: Key types to accept, e.g. ``['ssh-rsa']``.
+    :param min_length: Minimum key length in bits (inclusive).
+    :param max_length: Maximum key length in bits (inclusive).
+    :param fingerprints: Fingerprints to accept, either formatted (e.g.
+                         ``'SHA256:...'``, see
+                         :func:`~sshkeys.format_fingerprint`) or raw digests
+                         using ``fingerprint_alg``. Certificates match their
+                         own fingerprint and that of the certified key.
+    :param with_options: Names of options that must be present.
+    :param without_options: Names of options that must not be present.
+    :param option_values: Mapping of option names to required values. A value
+                          may be a string, ``True`` for a flag or a compiled
+                          regular expression that must match the value.
+    :param comment: Regular expression that must match the comment (using
+                    ``search``). Keys without a comment never match.
+    """
+
+    def __init__(self, types=None, min_length=None, max_length=None,
+                 fingerprints=None, fingerprint_alg='sha256',
+                 with_options=(), without_options=(), option_values=None,
+                 comment=None):
+        checks = []
+
+        if types is not None:
+            types = frozenset(types)
+            checks.append(lambda key: key.type in types)
+
+        if with_options:
+            required = tuple(with_options)
+            checks.append(lambda key: all(name in key.options
+                                          for name in required))
+
+        if without_options:
+            forbidden = tuple(without_options)
+            checks.append(lambda key: not any(name in key.options
+                                              for name in forbidden))
+
+        for name, expected in (option_values or {}).items():
+            checks.append(self._option_check(name, expected))
+
+        if comment is not None:
+            search = re.compile(comment).search
+            checks.append(lambda key: key.comment is not None and
+                          search(key.comment) is not None)
+
+        if fingerprints is not None:
+            checks.append(self._fingerprint_check(fingerprints,
+                                                  fingerprint_alg))
+
+        if min_length is not None or max_length is not None:
+            checks.append(self._length_check(min_length, max_length))
+
+        self._checks = tuple(checks)
+
+    @staticmethod
+    def _option_check(name, expected):
+        if hasattr(expected, 'search'):
+            search = expected.search
+
+            def check(key):
+                value = key.options.get(name)
+                return (value is not None and value is not True and
+                        search(value) is not None)
+        else:
+            def check(key):
+                return key.options.get(name) == expected
+        return check
+
+    @staticmethod
+    def _fingerprint_check(fingerprints, default_alg):
+        by_alg = {}
+        for fp in fingerprints:
+            if isinstance(fp, bytes):
+                alg, digest = default_alg, fp
+            else:
+                alg, digest = parse_fingerprint(fp)
+            by_alg.setdefault(alg, set()).add(digest)
+        by_alg = tuple(by_alg.items())
+
+        def check(key):
+            try:
+                # certificates also match by their certified key
+                fp_key = key.fingerprint_key
+                keys = (key,) if fp_key is key else (key, fp_key)
+                return any(k.get_fingerprint(alg) in digests
+                           for k in keys for alg, digests in by_alg)
+            except ValueError:
+                # lazily loaded key with invalid data
+                return False
+        return check
+
+    @staticmethod
+    def _length_check(min_length, max_length):
+        low = 0 if min_length is None else min_length
+        high = float('inf') if max_length is None else max_length
+
+        def check(key):
+            try:
+                return low <= key.length <= high
+            except (NotImplementedError, ValueError):
+                return False
+        return check
+
+    def __call__(self, key):
+        for check in self._checks:
+            if not check(key):
+                return False
+        return True
+
+    def filter(self, entries):
+        """Yield the matching items of ``entries``, which may hold keys or
+        the ``(lineno, key)`` tuples produced by :meth:`Key.iter_pubkey_file`
+        (parse errors never match)."""
+        for entry in entries:
+            key = entry[1] if isinstance(entry, tuple) else entry
+            if isinstance(key, Key) and self(key):
+                yield entry
+
+    def filter_file(self, file):
+        """Yield the matching ``(lineno, key)`` tuples of a file, parsing it
+        lazily."""
+        return self.filter(Key.iter_pubkey_file(file, lazy=True))
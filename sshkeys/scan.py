@@ -0,0 +1,95 @@
+"""Scanning of very large key files through a memory map.
+
+Instead of reading a file into a string, :func:`scan_file` maps it into
+memory and locates lines in the raw buffer. Key data is decoded straight
+from the mapped bytes; only options and comments are turned into strings.
+Scans can be restricted to a byte range, allowing a single file to be split
+into chunks that are processed independently (see :func:`split_ranges`)."""
+
+import mmap
+import os
+from binascii import a2b_base64
+
+from . import KEY_TYPES, Key, KeyParseError, read_prefixed
+
+
+def _parse_line(line):
+    # parses a single, stripped line of bytes
+    type_end = line.find(b' ')
+    head = line[:type_end] if type_end > 0 else b''
+    if head not in KEY_TYPES:
+        # options present (or garbage), leave it to the regular parser
+        return Key.from_pubkey_line(line.decode('utf-8', 'replace'))
+
+    fields = line.split(None, 2)
+    if len(fields) < 2:
+        raise KeyParseError('Key has insufficient number of fields')
+
+    try:
+        data = a2b_base64(fields[1])
+        key_type = read_prefixed(data)[0]
+    except ValueError:
+        raise KeyParseError('Key contains invalid data')
+
+    comment = None
+    if len(fields) == 3:
+        comment = fields[2].decode('utf-8', 'replace')
+
+    return Key._class_for_type(key_type)(data, comment)
+
+
+def scan_file(path, start=0, end=None):
+    """Scan a file in ``authorized_keys`` format through a memory map.
+
+    Yields ``(offset, key)`` tuples, where ``offset`` is the position of the
+    line in the file. As with :meth:`Key.iter_pubkey_file`, blank lines and
+    comments are skipped and parse errors are yielded in place of the key.
+
+    Only lines beginning inside the byte range ``[start, end)`` are scanned,
+    so adjacent ranges yield every line exactly once."""
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            # empty files cannot be mapped
+            return
+
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for item in _scan(mm, start, size if end is None else end):
+                yield item
+        finally:
+            mm.close()
+
+
+def _scan(mm, start, end):
+    size = len(mm)
+    end = min(end, size)
+
+    pos = start
+    if pos > 0 and mm[pos - 1:pos] != b'\n':
+        # inside a line that belongs to the previous range
+        nl = mm.find(b'\n', pos)
+        pos = size if nl < 0 else nl + 1
+
+    while pos < end:
+        nl = mm.find(b'\n', pos)
+        if nl < 0:
+            nl = size
+        offset, line, pos = pos, mm[pos:nl].strip(), nl + 1
+
+        if not line or line.startswith(b'#'):
+            continue
+
+        try:
+            yield offset, _parse_line(line)
+        except KeyParseError as e:
+            e.line = line.decode('utf-8', 'replace')
+            yield offset, e
+
+
+def split_ranges(path, n):
+    """Split a file into ``n`` byte ranges of roughly equal size, suitable for
+    passing to :func:`scan_file`."""
+    size = os.path.getsize(path)
+    bounds = [size * i // n for i in range(n + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
@@ -0,0 +1,15 @@
+import pytest
+
+
+@pytest.fixture
+def write_keyfile(tmpdir):
+    """Return a function writing text or bytes to a file in ``tmpdir``,
+    returning the path as ``py.path.local``."""
+    def write(content, name='authorized_keys'):
+        fn = tmpdir.join(name)
+        if isinstance(content, bytes):
+            fn.write_binary(content)
+        else:
+            fn.write(content)
+        return fn
+    return write
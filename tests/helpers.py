@@ -0,0 +1,22 @@
+import os
+
+from sshkeys import Key
+
+base_path = os.path.abspath(os.path.dirname(__file__))
+
+
+def sample_path(name):
+    return os.path.join(base_path, name)
+
+
+def sample(name):
+    with open(sample_path(name)) as f:
+        return f.read()
+
+
+def sample_line(name, prefix=''):
+    return prefix + sample(name).strip()
+
+
+def sample_key(name):
+    return Key.from_pubkey_file(sample_path(name))
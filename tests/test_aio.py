@@ -0,0 +1,189 @@
+import asyncio
+import functools
+import socket
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from sshkeys import Key, KeyParseError
+from sshkeys.aio import (from_pubkey_file, from_pubkey_stream, iter_keys,
+                         iter_pubkey_file, iter_pubkey_stream)
+
+from .helpers import sample, sample_path
+
+SAMPLES = ['sample_rsa.key.pub', 'sample_dsa.key.pub',
+           'sample_ecdsa256.key.pub', 'sample_ed25519.key.pub',
+           'sample_rsa2048.key-cert.pub']
+
+needs_unix_sockets = pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'),
+                                        reason='requires Unix sockets')
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+async def _collect(aiter):
+    return [item async for item in aiter]
+
+
+def _summary(entries):
+    return [(lineno, key.reason if isinstance(key, KeyParseError)
+             else key.to_pubkey_line()) for lineno, key in entries]
+
+
+class CountingExecutor(ThreadPoolExecutor):
+    def __init__(self):
+        super(CountingExecutor, self).__init__(max_workers=2)
+        self.calls = 0
+
+    def submit(self, *args, **kwargs):
+        self.calls += 1
+        return super(CountingExecutor, self).submit(*args, **kwargs)
+
+
+@pytest.fixture
+def content():
+    lines = [sample(fn) for fn in SAMPLES]
+    lines.insert(2, '# comment\n\n')
+    lines.insert(4, 'ssh-rsa AAAA*broken\n')
+    return ''.join(lines)
+
+
+@pytest.fixture
+def keyfile(write_keyfile, content):
+    return str(write_keyfile(content))
+
+
+@pytest.mark.parametrize('batch_size', [1, 2, 256])
+def test_iter_pubkey_file(keyfile, batch_size):
+    executor = CountingExecutor()
+    entries = _run(_collect(iter_pubkey_file(keyfile, executor=executor,
+                                             batch_size=batch_size)))
+    assert _summary(entries) == _summary(Key.iter_pubkey_file(keyfile))
+    assert [lineno for lineno, _ in entries] == [1, 2, 5, 6, 7, 8]
+    # open, one call per batch plus the final empty one, close
+    assert executor.calls == 3 + -(-8 // batch_size)
+
+
+def test_iter_pubkey_file_missing(tmpdir):
+    with pytest.raises(OSError):
+        _run(_collect(iter_pubkey_file(str(tmpdir.join('missing')))))
+
+
+@pytest.mark.parametrize('chunk', [1, 7, 10000])
+def test_iter_pubkey_stream(content, chunk):
+    data = content.rstrip('\n').encode('utf-8')  # no final newline
+
+    async def read():
+        reader = asyncio.StreamReader()
+        for i in range(0, len(data), chunk):
+            reader.feed_data(data[i:i + chunk])
+        reader.feed_eof()
+        return await _collect(iter_pubkey_stream(reader, batch_size=3))
+
+    assert _summary(_run(read())) == _summary(
+        Key.iter_pubkey_lines(content.splitlines()))
+
+
+def test_invalid_utf8(write_keyfile):
+    data = (b'# comment\n' + sample('sample_dsa.key.pub').encode('ascii') +
+            b'ssh-rsa AAAA caf\xe9@host\n' +
+            sample('sample_ed25519.key.pub').encode('ascii'))
+    fn = write_keyfile(data)
+
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await _collect(iter_pubkey_stream(reader))
+
+    expected = [(2, sample('sample_dsa.key.pub').strip()),
+                (3, 'Invalid UTF-8'),
+                (4, sample('sample_ed25519.key.pub').strip())]
+    assert _summary(_run(_collect(iter_pubkey_file(str(fn))))) == expected
+    assert _summary(_run(read())) == expected
+
+
+def test_from_pubkey_file_and_subprocess():
+    path = sample_path('sample_ed25519.key.pub')
+
+    async def load():
+        # stands in for ``ssh-keygen -y -f key``
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable, '-c',
+            'import sys; sys.stdout.write(open(sys.argv[1]).read())', path,
+            stdout=asyncio.subprocess.PIPE)
+        key = await from_pubkey_stream(proc.stdout)
+        await proc.wait()
+        return key, await from_pubkey_file(path)
+
+    from_stream, from_file = _run(load())
+    assert from_stream == from_file == Key.from_pubkey_file(path)
+    assert from_stream.comment == 'sample_ed25519_key@host'
+
+
+@needs_unix_sockets
+def test_iter_keys(tmpdir, keyfile):
+    sock = str(tmpdir.join('keys.sock'))
+    missing = str(tmpdir.join('missing'))
+    active = [0, 0]  # current and maximum number of connections
+
+    async def serve(reader, writer):
+        active[0] += 1
+        active[1] = max(active)
+        await asyncio.sleep(0.01)
+        writer.write(sample('sample_ecdsa256.key.pub').encode('ascii'))
+        await writer.drain()
+        writer.close()
+        active[0] -= 1
+
+    async def gather():
+        server = await asyncio.start_unix_server(serve, sock)
+        connect = functools.partial(asyncio.open_unix_connection, sock)
+        reader = asyncio.StreamReader()
+        reader.feed_data(sample('sample_dsa.key.pub').encode('ascii'))
+        reader.feed_eof()
+        try:
+            return await _collect(iter_keys(
+                [keyfile, missing, reader] + [connect] * 5, limit=2))
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    results = _run(gather())
+    assert len(results) == 6 + 1 + 1 + 5
+    assert 1 <= active[1] <= 2
+
+    errors = [key for source, _, key in results if source == missing]
+    assert len(errors) == 1 and isinstance(errors[0], OSError)
+
+    from_file = [(lineno, key) for source, lineno, key in results
+                 if source == keyfile]
+    assert _summary(from_file) == _summary(Key.iter_pubkey_file(keyfile))
+
+    ecdsa = Key.from_pubkey_line(sample('sample_ecdsa256.key.pub'))
+    assert [key for source, _, key in results
+            if callable(source)] == [ecdsa] * 5
+
+
+def test_iter_keys_early_exit(keyfile):
+    async def first():
+        keys = iter_keys([keyfile] * 10, limit=3, batch_size=1)
+        item = await keys.__anext__()
+        await keys.aclose()
+        # no workers are left running
+        assert asyncio.all_tasks() == {asyncio.current_task()}
+        return item
+
+    source, lineno, key = _run(first())
+    assert (source, lineno) == (keyfile, 1)
+
+
+def test_iter_keys_error():
+    async def broken():
+        raise RuntimeError('boom')
+
+    with pytest.raises(RuntimeError):
+        _run(_collect(iter_keys([broken])))
@@ -0,0 +1,98 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from sshkeys.audit import (AuditStats, _bounded_map, audit,
+                           find_authorized_keys)
+from sshkeys.cli import main
+
+from .helpers import sample
+
+
+@pytest.fixture
+def homes(tmpdir):
+    for i in range(10):
+        ssh = tmpdir.mkdir('user%d' % i).mkdir('.ssh')
+        ssh.join('authorized_keys').write(
+            '# keys\n' + sample('sample_rsa.key.pub') +
+            'no-pty ' + sample('sample_ecdsa256.key.pub'))
+        ssh.join('id_rsa.pub').write(sample('sample_rsa.key.pub'))
+    tmpdir.join('user3', '.ssh', 'authorized_keys2').write('ssh-rsa AAAA\n')
+    return tmpdir
+
+
+def test_find_authorized_keys(homes):
+    files = list(find_authorized_keys([str(homes)]))
+    assert len(files) == 11
+    assert files[0] == str(homes.join('user0', '.ssh', 'authorized_keys'))
+
+    assert list(find_authorized_keys(['/does/not/exist'])) == [
+        '/does/not/exist']
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_audit(homes, workers):
+    stats = AuditStats()
+    records = list(audit([str(homes), '/does/not/exist'], workers=workers,
+                         chunksize=3, stats=stats))
+
+    assert stats.files == 12
+    assert stats.lines == 21
+    assert stats.errors == 2
+    assert stats.files_per_second > 0
+
+    first = records[0]
+    assert first.path == str(homes.join('user0', '.ssh', 'authorized_keys'))
+    assert first.lineno == 2
+    assert first.type == 'ssh-rsa'
+    assert first.length == 4096
+    assert first.fingerprint == (
+        'SHA256:zoVoh6gre0C/0p1pGCUFiPGvcE703s4yk16zohMS6T0')
+    assert first.options == ()
+    assert first.error is None
+
+    assert records[1].options == (('no-pty', True),)
+    assert records[1].length == 256
+
+    errors = [r for r in records if r.error]
+    assert errors[0].lineno == 1
+    assert errors[0].error == 'Key contains invalid data'
+    assert errors[1].path == '/does/not/exist'
+    assert errors[1].lineno is None
+
+
+def test_bounded_map():
+    taken = []
+
+    def args():
+        for i in range(10):
+            taken.append(i)
+            yield i
+
+    with ThreadPoolExecutor(2) as executor:
+        results = _bounded_map(executor, lambda i: i * i, args(), 3)
+        assert next(results) == 0
+        assert len(taken) == 3
+        assert list(results) == [i * i for i in range(1, 10)]
+
+
+def test_audit_certificate(tmpdir):
+    ssh = tmpdir.mkdir('.ssh')
+    ssh.join('authorized_keys').write(sample('sample_ed25519.key-cert.pub'))
+    record, = audit([str(tmpdir)], workers=1)
+    # as shown by ssh-keygen -lf
+    assert record.fingerprint == (
+        'SHA256:II1fwPH9JObhdRr10NMBozqnfIVcan083hL9IR/O88I')
+    assert record.type == 'ssh-ed25519-cert-v01@openssh.com'
+
+
+def test_cli_audit(homes, capsys):
+    assert main(['audit', '-j', '1', str(homes.join('user1'))]) == 0
+    out, err = capsys.readouterr()
+
+    lines = out.splitlines()
+    assert len(lines) == 2
+    assert lines[1].split('\t')[1:] == [
+        '3', 'ecdsa-sha2-nistp256', '256',
+        'SHA256:o8FYEYE0ROG0DGcXFN644bO5R27o1EdjFiqT7g5iVK8', 'no-pty', '']
+    assert 'audited 1 files, 2 lines' in err
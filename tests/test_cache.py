@@ -0,0 +1,93 @@
+import pytest
+
+from sshkeys import Key, KeyParseError
+from sshkeys.cache import KeyFileCache
+
+from .helpers import sample
+
+
+@pytest.fixture
+def keyfile(write_keyfile):
+    return write_keyfile(sample('sample_rsa.key.pub') + '# comment\n' +
+                         sample('sample_dsa.key.pub') + 'ssh-rsa\n')
+
+
+def test_cache_hit(keyfile, monkeypatch):
+    cache = KeyFileCache()
+    items = cache.load(str(keyfile))
+
+    assert [lineno for lineno, _ in items] == [1, 3, 4]
+    assert isinstance(items[2][1], KeyParseError)
+    assert cache.misses == 1
+    assert cache.lines_parsed == 3
+
+    def no_parse(*args, **kwargs):
+        raise AssertionError('file was parsed again')
+    monkeypatch.setattr(Key, 'from_pubkey_line', no_parse)
+
+    assert cache.load(str(keyfile)) is items
+    assert cache.hits == 1
+    assert cache.bytes == keyfile.size()
+
+
+def test_cache_reuses_unchanged_lines(keyfile):
+    cache = KeyFileCache()
+    items = cache.load(str(keyfile))
+
+    keyfile.write(sample('sample_ecdsa256.key.pub') + keyfile.read())
+    new_items = cache.load(str(keyfile))
+
+    assert cache.misses == 2
+    # the new line and the broken one, errors are not cached
+    assert cache.lines_parsed == 5
+    assert cache.lines_reused == 2
+    assert [lineno for lineno, _ in new_items] == [1, 2, 4, 5]
+    assert new_items[1][1] is items[0][1]
+    assert new_items[2][1] is items[1][1]
+    assert new_items[3][1].lineno == 5
+
+
+def test_cache_eviction(tmpdir, keyfile):
+    cache = KeyFileCache(max_entries=2, max_bytes=3 * keyfile.size())
+    paths = []
+    for i in range(3):
+        fn = tmpdir.join('keys%d' % i)
+        fn.write(keyfile.read())
+        paths.append(str(fn))
+        cache.load(str(fn))
+
+    assert len(cache) == 2
+    assert paths[0] not in cache
+    assert cache.evictions == 1
+
+    # touching paths[1] makes paths[2] the least recently used entry
+    cache.load(paths[1])
+    cache.max_bytes = keyfile.size()
+    cache.load(paths[0])
+    assert list(cache._entries) == [paths[0]]
+    assert cache.bytes == keyfile.size()
+
+    cache.invalidate(paths[0])
+    assert len(cache) == 0
+    assert cache.bytes == 0
+
+
+def test_cache_deleted_file(keyfile):
+    cache = KeyFileCache()
+    cache.load(str(keyfile))
+    keyfile.remove()
+
+    with pytest.raises(OSError):
+        cache.load(str(keyfile))
+    assert str(keyfile) not in cache
+    assert cache.bytes == 0
+
+
+def test_cache_invalid_utf8(write_keyfile):
+    fn = write_keyfile(b'ssh-rsa AAAA caf\xe9@host\n' +
+                       sample('sample_dsa.key.pub').encode('ascii'))
+    items = KeyFileCache().load(str(fn))
+
+    assert [lineno for lineno, _ in items] == [1, 2]
+    assert items[0][1].reason == 'Invalid UTF-8'
+    assert items[1][1].comment == 'sample_dsa_key@host'
@@ -0,0 +1,225 @@
+import getpass
+import io
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from sshkeys import Key
+from sshkeys.cli import _expand_tokens, main
+
+from .helpers import base_path, sample, sample_path
+
+root_path = os.path.dirname(base_path)
+
+# overhead of a CLI invocation over starting a bare interpreter, in seconds.
+# Kept generous so slow CI machines pass; see benchmarks/bench_startup.py for
+# precise numbers
+STARTUP_BUDGET = 0.5
+
+# modules that must not be imported just to run the CLI
+HEAVY_MODULES = ['six', 'concurrent.futures', 'multiprocessing', 'asyncio',
+                 'mmap', 'tempfile', 'pwd', 'hmac', 'fnmatch']
+
+SAMPLES = ['sample_rsa.key.pub', 'sample_rsa1024.key.pub',
+           'sample_ecdsa256.key.pub', 'sample_ed25519.key.pub']
+
+
+@pytest.fixture
+def keyfile(write_keyfile):
+    lines = [sample(fn) for fn in SAMPLES]
+    lines[1] = 'no-pty,command="echo \\"hi\\"" ' + lines[1]
+    lines.insert(2, '# comment\n\n')
+    lines.append('ssh-rsa AAAAB3NzaC1yc2EAAA*broken bad@host\n')
+    return str(write_keyfile(''.join(lines)))
+
+
+def _run(*args, **kwargs):
+    env = dict(os.environ, PYTHONPATH=root_path)
+    start = time.perf_counter()
+    subprocess.check_call([sys.executable] + list(args), env=env,
+                          stdout=subprocess.DEVNULL, **kwargs)
+    return time.perf_counter() - start
+
+
+def test_import_is_lean():
+    code = ('import sys, sshkeys.cli; '
+            'print(" ".join(m for m in %r if m in sys.modules))'
+            % HEAVY_MODULES)
+    out = subprocess.check_output(
+        [sys.executable, '-c', code],
+        env=dict(os.environ, PYTHONPATH=root_path))
+    assert out.split() == []
+
+
+def test_startup_budget(record_property):
+    path = sample_path('sample_rsa.key.pub')
+    _run('-m', 'sshkeys', '--help')  # warm up caches
+
+    baseline = min(_run('-c', 'pass') for _ in range(3))
+    latency = min(_run('-m', 'sshkeys', 'fingerprint', path)
+                  for _ in range(3))
+    record_property('cli_startup_seconds', latency)
+    record_property('cli_overhead_seconds', latency - baseline)
+    assert latency - baseline < STARTUP_BUDGET
+
+
+def test_no_command(capsys):
+    assert main([]) == 2
+    assert 'fingerprint' in capsys.readouterr().out
+
+
+def test_fingerprint(keyfile, capsys):
+    assert main(['fingerprint', keyfile]) == 1
+    out, err = capsys.readouterr()
+
+    keys = [Key.from_pubkey_line(sample(fn)) for fn in SAMPLES]
+    assert out.splitlines() == [
+        '%d %s %s (%s)' % (k.length, k.get_readable_fingerprint('sha256'),
+                           k.comment, k.type) for k in keys]
+    assert err.startswith('sshkeys: %s:7: ' % keyfile)
+
+
+def test_fingerprint_certificate(capsys):
+    # matches ``ssh-keygen -lf``, which shows the certified key
+    cert = sample_path('sample_ed25519.key-cert.pub')
+    assert main(['fingerprint', cert]) == 0
+    assert capsys.readouterr().out == (
+        '256 SHA256:II1fwPH9JObhdRr10NMBozqnfIVcan083hL9IR/O88I '
+        'sample_ed25519_key@host (ssh-ed25519-cert-v01@openssh.com)\n')
+
+
+def test_fingerprint_stdin(monkeypatch, capsys):
+    monkeypatch.setattr(sys, 'stdin',
+                        io.StringIO(sample('sample_rsa.key.pub')))
+    assert main(['fingerprint', '-E', 'md5']) == 0
+    assert capsys.readouterr().out == (
+        '4096 MD5:b9:e2:58:1a:74:fc:62:13:52:ad:f7:28:0b:09:91:54 '
+        'sample_rsa_key@host (ssh-rsa)\n')
+
+
+def test_missing_file(tmpdir, capsys):
+    missing = str(tmpdir.join('missing'))
+    assert main(['fingerprint', missing]) == 1
+    out, err = capsys.readouterr()
+    assert out == ''
+    assert err.startswith('sshkeys: ') and missing in err
+
+
+def test_list(keyfile, capsys):
+    assert main(['list', keyfile]) == 1
+    out, err = capsys.readouterr()
+    rows = [line.split('\t') for line in out.splitlines()]
+    assert [r[1:4] for r in rows] == [
+        ['1', 'ssh-rsa', '4096'],
+        ['2', 'ssh-rsa', '1024'],
+        ['5', 'ecdsa-sha2-nistp256', '256'],
+        ['6', 'ssh-ed25519', '256'],
+    ]
+    assert rows[1][5:] == ['no-pty,command="echo \\"hi\\""',
+                           'sample_rsa1024_key@host']
+    assert rows[0][5] == ''
+    assert all(r[4].startswith('SHA256:') for r in rows)
+    assert err.startswith('sshkeys: %s:7: ' % keyfile)
+
+
+def test_filter(keyfile, capsys):
+    # the broken key is rejected by the length check before being decoded
+    assert main(['filter', '-t', 'ssh-rsa', '--max-length', '2048',
+                 keyfile]) == 0
+    assert capsys.readouterr() == (
+        'no-pty,command="echo \\"hi\\"" ' +
+        sample('sample_rsa1024.key.pub'), '')
+
+    fp = Key.from_pubkey_line(
+        sample('sample_ed25519.key.pub')).get_readable_fingerprint('sha256')
+    assert main(['filter', '--fingerprint', fp, keyfile]) == 0
+    assert capsys.readouterr().out == sample('sample_ed25519.key.pub')
+
+    assert main(['filter', keyfile]) == 1
+    out, err = capsys.readouterr()
+    assert 'broken' not in out and len(out.splitlines()) == 4
+    assert err.startswith('sshkeys: %s:7: ' % keyfile)
+
+
+def test_filter_stdin(monkeypatch, capsys):
+    monkeypatch.setattr(sys, 'stdin', io.StringIO(
+        sample('sample_rsa.key.pub') + sample('sample_ecdsa256.key.pub')))
+    assert main(['filter', '--min-length', '2048', '-']) == 0
+    assert capsys.readouterr().out == sample('sample_rsa.key.pub')
+
+
+def test_expand_tokens():
+    assert _expand_tokens('%h/.ssh/%u_keys', 'bob', '/home/bob') == \
+        '/home/bob/.ssh/bob_keys'
+    assert _expand_tokens('/keys/%%u/%u', 'bob', '/home/bob') == \
+        '/keys/%u/bob'
+
+
+def test_authorized_keys(keyfile, tmpdir, capsys):
+    user = getpass.getuser()
+    template = str(tmpdir.join('%%_%u'))
+    os.rename(keyfile, str(tmpdir.join('%_' + user)))
+
+    # malformed lines must not make sshd discard the output
+    assert main(['authorized-keys', '-f', template, user]) == 0
+    out, err = capsys.readouterr()
+    assert out.splitlines() == [
+        Key.from_pubkey_line(line).to_pubkey_line()
+        for line in open(str(tmpdir.join('%_' + user)))
+        if line.strip() and not line.startswith('#') and 'broken' not in line]
+    assert 'broken' not in out
+    assert err.count('\n') == 1
+
+    assert main(['authorized-keys', '-f', template, '-t', 'ssh-ed25519',
+                 user]) == 0
+    assert capsys.readouterr().out == sample('sample_ed25519.key.pub')
+
+
+def test_authorized_keys_unreadable(tmpdir, monkeypatch, capsys):
+    user = getpass.getuser()
+    assert main(['authorized-keys', '-f', str(tmpdir.join('missing')),
+                 user]) == 0
+    assert capsys.readouterr().out == ''
+
+    # not readable by the AuthorizedKeysCommandUser; a directory stands in
+    # for it, as root can read any file
+    assert main(['authorized-keys', '-f', str(tmpdir), user]) == 1
+    out, err = capsys.readouterr()
+    assert out == ''
+    assert err.startswith('sshkeys: ')
+
+    def denied(path, mode='r'):
+        raise PermissionError(13, 'Permission denied', path)
+    monkeypatch.setattr('sshkeys.cli.open', denied, raising=False)
+    assert main(['authorized-keys', '-f', str(tmpdir.join('keys')),
+                 user]) == 1
+    assert 'Permission denied' in capsys.readouterr().err
+
+
+def test_authorized_keys_invalid_utf8(write_keyfile, capsys):
+    rsa = sample('sample_rsa.key.pub').rsplit(' ', 1)[0]
+    ed25519 = sample('sample_ed25519.key.pub').rsplit(' ', 1)[0]
+    fn = write_keyfile(rsa.encode('ascii') + b' J\xf6rg@host\n' +
+                       ed25519.encode('ascii') + b' J\xc3\xb6rg@host\n')
+
+    # a latin-1 comment must neither abort the command nor hide other keys
+    assert main(['authorized-keys', '-f', str(fn), getpass.getuser()]) == 0
+    out, err = capsys.readouterr()
+    assert out == ed25519 + ' J\xf6rg@host\n'
+    assert err.startswith('sshkeys: %s:1: Invalid UTF-8' % fn)
+
+    assert main(['fingerprint', str(fn)]) == 1
+    assert len(capsys.readouterr().out.splitlines()) == 1
+
+
+def test_authorized_keys_missing(tmpdir, capsys):
+    user = getpass.getuser()
+    assert main(['authorized-keys', '-f', str(tmpdir.join('nope')),
+                 user]) == 0
+    assert capsys.readouterr().out == ''
+
+    assert main(['authorized-keys', 'no-such-user-hopefully']) == 1
+    assert 'no such user' in capsys.readouterr().err
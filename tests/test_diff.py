@@ -0,0 +1,184 @@
+import pytest
+
+from sshkeys import Key
+from sshkeys.diff import (ADDED, CHANGED, REMOVED, UNCHANGED, changed_fields,
+                          diff, merge, merge_file)
+
+from .helpers import sample_line
+
+SAMPLES = ['sample_rsa.key.pub', 'sample_rsa1024.key.pub',
+           'sample_dsa.key.pub', 'sample_ecdsa256.key.pub',
+           'sample_ed25519.key.pub']
+
+
+@pytest.fixture
+def current(write_keyfile):
+    return str(write_keyfile('\n'.join([
+        '# managed',
+        sample_line('sample_rsa.key.pub', 'no-pty,from="10.0.0.0/8" '),
+        sample_line('sample_rsa1024.key.pub'),
+        sample_line('sample_dsa.key.pub', 'no-pty '),
+        'ssh-rsa AAAAB3NzaC1yc2EAAA broken',
+        sample_line('sample_ecdsa256.key.pub'),
+    ]) + '\n'))
+
+
+@pytest.fixture
+def desired():
+    return [
+        Key.from_pubkey_line(sample_line('sample_ed25519.key.pub')),
+        # option order differs, still unchanged
+        Key.from_pubkey_line(
+            sample_line('sample_rsa.key.pub', 'from="10.0.0.0/8",no-pty ')),
+        Key.from_pubkey_line(
+            sample_line('sample_dsa.key.pub', 'no-pty ').replace(
+                'sample_dsa_key@host', 'backup@host')),
+        Key.from_pubkey_line(sample_line('sample_ecdsa256.key.pub',
+                                   'command="true" ')),
+    ]
+
+
+def _summary(changes):
+    return [(c.action, (c.old or c.new).comment, c.old_lineno, c.fields)
+            for c in changes]
+
+
+def test_changed_fields():
+    a = Key.from_pubkey_line(sample_line('sample_rsa.key.pub', 'a,b="1" '))
+    b = Key.from_pubkey_line(sample_line('sample_rsa.key.pub', 'b="1",a '))
+    c = Key.from_pubkey_line(sample_line('sample_rsa.key.pub', 'b="2",a '))
+    assert changed_fields(a, b) == ()
+    assert changed_fields(a, c) == ('options',)
+    c.comment = 'other'
+    assert changed_fields(a, c) == ('options', 'comment')
+
+
+@pytest.mark.parametrize('index', [None, 'old', 'new'])
+def test_diff(current, desired, index):
+    errors = []
+    changes = list(diff(current, desired, index=index, errors=errors))
+    assert sorted(_summary(changes)) == [
+        (ADDED, 'sample_ed25519_key@host', None, ()),
+        (CHANGED, 'sample_dsa_key@host', 4, ('comment',)),
+        (CHANGED, 'sample_ecdsa256_key@host', 6, ('options',)),
+        (REMOVED, 'sample_rsa1024_key@host', 3, ()),
+    ]
+    assert [e.lineno for e in errors] == [5]
+
+    changed = [c for c in changes if c.action == CHANGED]
+    assert changed[0].new.comment == 'backup@host'
+    assert changed[0].new_lineno is None
+
+
+def test_diff_order(current, desired):
+    # the in-memory side is indexed, the file streamed in order
+    changes = list(diff(current, desired, include_unchanged=True))
+    assert [c.old_lineno for c in changes] == [2, 3, 4, 6, None]
+    assert changes[0].action == UNCHANGED
+
+    # reversed roles: desired is streamed
+    changes = list(diff(current, desired, index='old'))
+    assert [c.action for c in changes] == [ADDED, CHANGED, CHANGED, REMOVED]
+
+
+def test_diff_duplicates():
+    a = Key.from_pubkey_line(sample_line('sample_rsa.key.pub'))
+    b = Key.from_pubkey_line(sample_line('sample_ed25519.key.pub'))
+    old = [a, b, a]
+    new = [a, b]
+    for index in ('old', 'new'):
+        assert [(c.action, c.old is a)
+                for c in diff(old, new, index=index)] == [(REMOVED, True)]
+        assert [c.action for c in diff(new, old, index=index)] == [ADDED]
+
+
+def test_merge(current, desired):
+    errors = []
+    lines = [k if isinstance(k, str) else k.to_pubkey_line()
+             for k in merge(current, desired, errors=errors)]
+    # unchanged keys are kept as they were found, changed ones replaced,
+    # comments passed through
+    assert lines == [
+        '# managed',
+        sample_line('sample_rsa.key.pub', 'no-pty,from="10.0.0.0/8" '),
+        desired[2].to_pubkey_line(),
+        desired[3].to_pubkey_line(),
+        desired[0].to_pubkey_line(),
+    ]
+    assert len(errors) == 1
+
+    kept = list(merge(current, desired, remove=False, update=False))
+    assert [k[0] if isinstance(k, tuple) else getattr(k, 'comment', k)
+            for k in kept] == [
+        '# managed', 'sample_rsa_key@host', 'sample_rsa1024_key@host',
+        'sample_dsa_key@host', 5, 'sample_ecdsa256_key@host',
+        'sample_ed25519_key@host']
+
+
+def test_merge_file(current, desired):
+    assert merge_file(current, desired, remove=False) == 7
+    with open(current) as f:
+        assert f.readline() == '# managed\n'
+    result = [key for _, key in Key.iter_pubkey_file(current)]
+    assert result[3].line == 'ssh-rsa AAAAB3NzaC1yc2EAAA broken'
+
+    # only the key kept by remove=False still differs
+    assert [(c.action, c.old.comment) for c in diff(current, desired)] == [
+        (REMOVED, 'sample_rsa1024_key@host')]
+
+
+def test_merge_keeps_comments(write_keyfile):
+    fn = write_keyfile(b'# caf\xe9\n\n' +
+                       sample_line('sample_rsa.key.pub').encode('ascii') +
+                       b'\r\n  # indented\n' +
+                       sample_line('sample_dsa.key.pub').encode('ascii') +
+                       b'\n')
+    desired = [Key.from_pubkey_line(sample_line('sample_dsa.key.pub')),
+               Key.from_pubkey_line(sample_line('sample_ed25519.key.pub'))]
+
+    assert merge_file(str(fn), desired) == 5
+    assert fn.read_binary() == (
+        b'# caf\xe9\n\n  # indented\n' +
+        (sample_line('sample_dsa.key.pub') + '\n' +
+         sample_line('sample_ed25519.key.pub') + '\n').encode('ascii'))
+
+    # comments are not compared
+    assert list(diff(str(fn), desired)) == []
+
+
+def test_string_entries():
+    rsa = sample_line('sample_rsa.key.pub')
+    dsa = sample_line('sample_dsa.key.pub')
+    ed25519 = sample_line('sample_ed25519.key.pub', 'no-pty ')
+
+    # strings are parsed as lines on both sides, only comments and blank
+    # lines are passed through
+    current = ['# managed\n', rsa, '', ed25519 + '\n', 'ssh-rsa AAAA*broken']
+    desired = [dsa, rsa + '\n', '# ignored',
+               sample_line('sample_ed25519.key.pub')]
+    errors = []
+    result = [k if isinstance(k, str) else k.to_pubkey_line()
+              for k in merge(current, desired, index='desired',
+                             errors=errors)]
+    assert result == ['# managed', rsa, '',
+                      sample_line('sample_ed25519.key.pub'), dsa]
+    assert [(e.reason, e.line) for e in errors] == [
+        ('Key contains invalid data', 'ssh-rsa AAAA*broken')]
+
+    assert list(merge([Key.from_pubkey_line(rsa)], [dsa, rsa])) == [
+        Key.from_pubkey_line(dsa), Key.from_pubkey_line(rsa)]
+    assert _summary(diff([rsa], [dsa, rsa], index='old')) == [
+        (ADDED, 'sample_dsa_key@host', None, ())]
+
+
+def test_merge_index(current, desired):
+    # comments of the indexed side follow at the end
+    assert [getattr(k, 'comment', k) for k in merge(current, desired,
+                                                    index='current')] == [
+        'sample_ed25519_key@host', 'sample_rsa_key@host', 'backup@host',
+        'sample_ecdsa256_key@host', '# managed']
+
+    with pytest.raises(ValueError):
+        list(merge(current, desired, index='old'))
+    with pytest.raises(ValueError):
+        list(diff(current, desired, index='current'))
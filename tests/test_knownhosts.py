@@ -0,0 +1,129 @@
+import io
+
+import pytest
+
+from sshkeys import KeyParseError
+from sshkeys.knownhosts import (KnownHosts, host_name, iter_known_hosts,
+                                parse_known_hosts_line)
+
+from .helpers import sample, sample_key, sample_path
+
+known_hosts_file = sample_path('sample_known_hosts')
+
+
+@pytest.fixture
+def known_hosts():
+    return KnownHosts.from_file(known_hosts_file)
+
+
+def test_iter_known_hosts():
+    entries = list(iter_known_hosts(known_hosts_file))
+    assert [lineno for lineno, _ in entries] == [2, 3, 5, 6, 7, 8, 9, 10,
+                                                 11, 12]
+
+    lineno, entry = entries[0]
+    assert entry.marker is None
+    assert entry.patterns == ('plain.example.com', '192.0.2.1')
+    assert entry.key == sample_key('sample_rsa.key.pub')
+    assert entry.lineno == 2
+
+    assert entries[1][1].key.comment == 'comment'
+    assert entries[4][1].marker == '@cert-authority'
+    assert entries[5][1].marker == '@revoked'
+
+    errors = [e for _, e in entries if isinstance(e, KeyParseError)]
+    assert [e.reason for e in errors] == ['Key contains invalid data',
+                                          'Unknown marker']
+    assert errors[1].lineno == 12
+
+
+def test_iter_known_hosts_invalid_utf8():
+    key = sample_key('sample_rsa.key.pub').to_pubkey_line().encode('ascii')
+    data = b'caf\xe9.example.com ' + key + b'\ncafe.example.com ' + key
+    entries = list(iter_known_hosts(io.BytesIO(data)))
+
+    assert entries[0][1].reason == 'Invalid UTF-8'
+    assert entries[0][1].lineno == 1
+    assert entries[1][1].patterns == ('cafe.example.com',)
+
+
+def test_parse_line():
+    line = sample('sample_ed25519.key.pub')
+    entry = parse_known_hosts_line('@revoked a,b ' + line)
+    assert entry.marker == '@revoked'
+    assert entry.patterns == ('a', 'b')
+
+    for broken in ['host', '@revoked host', 'host no-pty ' + line]:
+        with pytest.raises(KeyParseError):
+            parse_known_hosts_line(broken)
+
+
+def test_host_name():
+    assert host_name('Example.COM') == 'example.com'
+    assert host_name('example.com', 2222) == '[example.com]:2222'
+
+
+def test_lookup_plain(known_hosts):
+    assert len(known_hosts) == 8
+    assert len(known_hosts.errors) == 2
+
+    assert known_hosts.keys_for('PLAIN.example.com') == [
+        sample_key('sample_rsa.key.pub')]
+    assert known_hosts.keys_for('192.0.2.1') == [sample_key('sample_rsa.key.pub')]
+    assert known_hosts.keys_for('plain.example.com', 2222) == [
+        sample_key('sample_ecdsa256.key.pub')]
+    assert known_hosts.keys_for('other.example.org') == []
+
+
+def test_lookup_wildcards(known_hosts):
+    assert known_hosts.keys_for('a.wild.example.com') == [
+        sample_key('sample_dsa.key.pub')]
+    assert known_hosts.keys_for('bad.wild.example.com') == []
+
+    # web1 matches, but its key is revoked for all hosts
+    entries = known_hosts.lookup('web1.example.com')
+    assert [e.lineno for e in entries] == [6, 7, 8]
+    assert known_hosts.keys_for('web1.example.com') == []
+    assert known_hosts.is_revoked(sample_key('sample_rsa1024.key.pub'))
+    assert known_hosts.is_revoked(sample_key('sample_rsa1024.key.pub'), 'x')
+    assert not known_hosts.is_revoked(sample_key('sample_rsa.key.pub'))
+
+    assert known_hosts.authorities_for('web1.example.com') == [
+        sample_key('sample_ca.key.pub')]
+    assert known_hosts.authorities_for('example.org') == []
+
+
+def test_lookup_bracketed_wildcards():
+    key = sample_key('sample_ed25519.key.pub').to_pubkey_line()
+    known_hosts = KnownHosts([
+        parse_known_hosts_line('[*.example.com]:2222 ' + key),
+        parse_known_hosts_line('[db?.example.org]:* ' + key),
+    ])
+    assert known_hosts.errors == []
+
+    assert len(known_hosts.keys_for('a.example.com', 2222)) == 1
+    assert known_hosts.keys_for('a.example.com') == []
+    assert known_hosts.keys_for('e', 2222) == []
+    assert len(known_hosts.keys_for('db1.example.org', 2200)) == 1
+    assert known_hosts.keys_for('db12.example.org', 2200) == []
+    assert known_hosts.keys_for('dbx.example.orgx', 2200) == []
+
+
+def test_lookup_hashed(known_hosts):
+    assert known_hosts.keys_for('hashed.example.com') == [
+        sample_key('sample_ed25519.key.pub')]
+    assert known_hosts.keys_for('hashed.example.com', 2222) == [
+        sample_key('sample_ecdsa256.key.pub')]
+    assert 'hashed.example.com' in known_hosts._cache
+
+    # the cache is reset when new hashed entries are added
+    line = open(known_hosts_file).readlines()[8]
+    known_hosts.add(parse_known_hosts_line(line))
+    assert known_hosts._cache == {}
+    assert len(known_hosts.keys_for('hashed.example.com')) == 2
+
+
+def test_invalid_hash_never_matches():
+    line = sample('sample_rsa.key.pub')
+    known_hosts = KnownHosts.from_file(io.StringIO(u'|1|abc ' + line))
+    assert known_hosts.lookup('abc') == []
@@ -0,0 +1,190 @@
+import io
+import struct
+from hashlib import sha256
+
+import pytest
+
+from sshkeys import KeyParseError
+from sshkeys.krl import KRL_MAGIC, RevocationList
+
+from .helpers import sample, sample_key, sample_path
+
+# generated with ``ssh-keygen -k -s sample_ca.key.pub -z 3``, revoking
+# serials 42, 100-199, 1000-1030 (even), 5000 and 9000000, key id
+# revoked_id, the DSA key, the SHA1 fingerprint of the ECDSA key and the
+# SHA256 fingerprint of the RSA 1024 key
+krl_file = sample_path('sample.krl')
+
+
+def _string(data):
+    return struct.pack('!I', len(data)) + data
+
+
+def _section(section_type, data):
+    return struct.pack('!B', section_type) + _string(data)
+
+
+def _krl(*sections):
+    header = (KRL_MAGIC + struct.pack('!IQQQ', 1, 7, 0, 0) + _string(b'') +
+              _string(b'test krl'))
+    return header + b''.join(sections)
+
+
+@pytest.fixture
+def krl():
+    return RevocationList.from_file(krl_file)
+
+
+def test_load_krl(krl):
+    ca = sample_key('sample_ca.key.pub')
+    assert krl.version == 3
+    assert krl.comment == ''
+    assert krl.signatures == []
+    assert krl.revoked_serials() == []
+    assert krl.revoked_serials(ca) == (
+        [(42, 42), (100, 199)] +
+        [(i, i) for i in range(1000, 1031, 2)] +
+        [(5000, 5000), (9000000, 9000000)])
+
+
+@pytest.mark.parametrize('name,revoked', [
+    ('sample_rsa2048.key-cert.pub', True),     # serial 42
+    ('sample_ed25519.key-cert.pub', False),    # serial 7
+    ('sample_dsa.key.pub', True),              # explicit key
+    ('sample_ecdsa256.key.pub', True),         # SHA1 fingerprint
+    ('sample_rsa1024.key.pub', True),          # SHA256 fingerprint
+    ('sample_rsa.key.pub', False),
+    ('sample_ed25519.key.pub', False),
+    ('sample_ca.key.pub', False),
+])
+def test_is_revoked(krl, name, revoked):
+    # results match ``ssh-keygen -Q -f sample.krl``
+    key = sample_key(name)
+    assert krl.is_revoked(key) is revoked
+    assert (key in krl) is revoked
+
+
+def test_revoked_certificates(krl):
+    cert = sample_key('sample_ed25519.key-cert.pub')
+
+    other = RevocationList()
+    other.revoke_serials(7)
+    assert other.is_revoked(cert)  # any CA
+
+    other = RevocationList()
+    other.revoke_serials(7, ca=sample_key('sample_rsa.key.pub'))
+    assert not other.is_revoked(cert)
+
+    other.revoke_key_id('sample_host', ca=cert.signature_key)
+    assert other.is_revoked(cert)
+
+    # revoking the certified key or the CA key revokes the certificate
+    other = RevocationList()
+    other.revoke_key(sample_key('sample_ed25519.key.pub'))
+    assert other.is_revoked(cert)
+    assert other.is_revoked(sample_key('sample_ed25519.key.pub'))
+
+    other = RevocationList()
+    other.revoke_key(sample_key('sample_ca.key.pub'))
+    assert other.is_revoked(cert)
+    assert not other.is_revoked(sample_key('sample_ed25519.key.pub'))
+
+
+def test_serial_intervals():
+    krl = RevocationList()
+    for low, high in [(10, 20), (5, 5), (21, 25), (18, 19), (100, 100)]:
+        krl.revoke_serials(low, high)
+    assert krl.revoked_serials() == [(5, 5), (10, 25), (100, 100)]
+
+    serials = krl._certs[None]
+    assert [s for s in range(0, 110) if s in serials] == (
+        [5] + list(range(10, 26)) + [100])
+
+    krl.revoke_serials(6, 9)
+    assert 7 in serials
+    assert krl.revoked_serials() == [(5, 25), (100, 100)]
+
+
+def test_constructed_krl():
+    ecdsa = sample_key('sample_ecdsa256.key.pub')
+    rsa = sample_key('sample_rsa.key.pub')
+    certs = (_string(b'') + _string(b'') +
+             _section(0x20, struct.pack('!QQ', 3, 9)) +
+             _section(0x22, struct.pack('!Q', 64) + _string(b'\x05\x01')) +
+             _section(0x23, _string(b'bob') + _string(b'eve')))
+    data = _krl(
+        _section(1, certs),
+        _section(2, _string(ecdsa.data)),
+        _section(5, _string(sha256(rsa.data).digest())),
+    ) + b'\x04' + _string(b'signer') + _string(b'signature')
+    krl = RevocationList.from_bytes(data)
+    assert krl.version == 7
+    assert krl.comment == 'test krl'
+    assert krl.signatures == [(b'signer', b'signature')]
+    # bitmap 0x0501: bits 0, 8 and 10
+    assert krl.revoked_serials() == [(3, 3), (9, 9), (64, 64), (72, 72),
+                                     (74, 74)]
+    assert krl._certs[None].key_ids == {'bob', 'eve'}
+    assert krl.is_revoked(ecdsa)
+    assert krl.is_revoked(rsa)
+    assert not krl.is_revoked(sample_key('sample_dsa.key.pub'))
+
+
+@pytest.mark.parametrize('data', [
+    b'SSHKRL\n\0',
+    b'SSHKRX\n\0' + b'\0' * 40,
+    _krl()[:30],
+    _krl(_section(9, b'')),
+    _krl(_section(1, _string(b'') + _string(b'') + _section(0x24, b''))),
+    _krl(_section(1, _string(b'') + _string(b'') + _section(0x20, b'x'))),
+    _krl(_section(2, b'\0\0\0\x09abc')),
+    _krl() + b'\x01\0\0',
+    _krl() + b'\x04' + _string(b'signer'),
+    _krl() + b'\x04' + _string(b'signer') + _string(b'sig') +
+    _section(2, b''),
+])
+def test_malformed_krl(data):
+    with pytest.raises(ValueError):
+        RevocationList.from_bytes(data)
+
+
+def test_plain_revoked_keys(write_keyfile):
+    fn = write_keyfile('# revoked\n' + sample('sample_rsa.key.pub') +
+                       'ssh-rsa AAAA*broken\n' + sample('sample_ca.key.pub'),
+                       'revoked_keys')
+    krl = RevocationList.from_file(str(fn))
+    assert [e.lineno for e in krl.errors] == [3]
+    assert krl.is_revoked(sample_key('sample_rsa.key.pub'))
+    assert krl.is_revoked(sample_key('sample_rsa2048.key-cert.pub'))
+    assert not krl.is_revoked(sample_key('sample_rsa2048.key.pub'))
+
+    krl = RevocationList.from_file(io.BytesIO(b''))
+    assert not krl.is_revoked(sample_key('sample_rsa.key.pub'))
+
+
+def test_revoke_fingerprint():
+    krl = RevocationList()
+    krl.revoke_fingerprint(sample_key('sample_rsa.key.pub')
+                           .get_readable_fingerprint('sha1'))
+    krl.revoke_fingerprint(
+        sample_key('sample_dsa.key.pub').get_fingerprint('sha256'))
+    assert krl.is_revoked(sample_key('sample_rsa.key.pub'))
+    assert krl.is_revoked(sample_key('sample_dsa.key.pub'))
+    assert not krl.is_revoked(sample_key('sample_ecdsa256.key.pub'))
+
+    with pytest.raises(ValueError):
+        krl.revoke_fingerprint('MD5:' + ':'.join(['00'] * 16))
+
+
+def test_filter(krl, write_keyfile):
+    names = ['sample_rsa.key.pub', 'sample_dsa.key.pub',
+             'sample_rsa2048.key-cert.pub', 'sample_ed25519.key.pub',
+             'sample_rsa1024.key.pub']
+    fn = write_keyfile(''.join(sample(n) for n in names) +
+                       'ssh-rsa AAAA*broken\n')
+
+    assert [lineno for lineno, _ in krl.filter_file(str(fn))] == [1, 4]
+
+    keys = [sample_key(n) for n in names]
+    assert list(krl.filter(keys)) == [keys[0], keys[3]]
+    assert list(krl.filter([(1, KeyParseError('Broken'))])) == []
@@ -0,0 +1,97 @@
+import re
+
+import pytest
+
+from sshkeys import Key, parse_fingerprint
+from sshkeys.query import KeyFilter
+
+from .helpers import sample, sample_path
+
+SAMPLES = ['sample_rsa.key.pub', 'sample_rsa2048.key.pub',
+           'sample_rsa1024.key.pub', 'sample_dsa.key.pub',
+           'sample_ecdsa256.key.pub', 'sample_ed25519.key.pub']
+
+
+@pytest.fixture
+def keyfile(write_keyfile):
+    lines = [sample(fn) for fn in SAMPLES]
+    lines[1] = 'from="10.0.0.0/8",no-pty ' + lines[1]
+    lines[3] = 'command="/bin/backup --full" ' + lines[3]
+    lines.append('ssh-rsa AAAAB3NzaC1yc2EAAA*broken bad@host\n')
+    return str(write_keyfile(''.join(lines)))
+
+
+def _comments(entries):
+    return [key.comment for _, key in entries]
+
+
+def test_filter_type_and_length(keyfile):
+    f = KeyFilter(types=['ssh-rsa'], max_length=3071,
+                  without_options=['from'])
+    assert _comments(f.filter_file(keyfile)) == ['sample_rsa1024_key@host']
+
+    f = KeyFilter(min_length=2048, max_length=4096)
+    assert _comments(f.filter_file(keyfile)) == [
+        'sample_rsa_key@host', 'sample_rsa2048_key@host']
+
+
+def test_filter_options(keyfile):
+    f = KeyFilter(with_options=['no-pty'])
+    assert _comments(f.filter_file(keyfile)) == ['sample_rsa2048_key@host']
+
+    f = KeyFilter(option_values={'command': re.compile(r'^/bin/backup\b')})
+    assert _comments(f.filter_file(keyfile)) == ['sample_dsa_key@host']
+
+    f = KeyFilter(option_values={'from': '10.0.0.0/8', 'no-pty': True})
+    assert _comments(f.filter_file(keyfile)) == ['sample_rsa2048_key@host']
+
+
+def test_filter_comment_and_fingerprint(keyfile):
+    f = KeyFilter(comment=r'^sample_ecdsa|ed25519')
+    assert _comments(f.filter_file(keyfile)) == [
+        'sample_ecdsa256_key@host', 'sample_ed25519_key@host']
+
+    f = KeyFilter(fingerprints=[
+        'SHA256:II1fwPH9JObhdRr10NMBozqnfIVcan083hL9IR/O88I',
+        'c5:37:9e:1a:8b:1a:25:09:44:ec:8e:cb:85:ab:95:7a',
+        parse_fingerprint('SHA1:8yj3O3O/KI6iBV+XD7Wx8AqHU3s')[1],
+    ], fingerprint_alg='sha1')
+    assert _comments(f.filter_file(keyfile)) == [
+        'sample_rsa1024_key@host', 'sample_dsa_key@host',
+        'sample_ed25519_key@host']
+
+
+def test_filter_certificate_fingerprint():
+    # certificates match the fingerprint ssh-keygen -l shows for them
+    with open(sample_path('sample_ed25519.key-cert.pub')) as f:
+        cert = Key.from_pubkey_line(f.read())
+    f = KeyFilter(fingerprints=[
+        'SHA256:II1fwPH9JObhdRr10NMBozqnfIVcan083hL9IR/O88I'])
+    assert list(f.filter([cert])) == [cert]
+    f = KeyFilter(fingerprints=[cert.get_fingerprint('sha256')])
+    assert list(f.filter([cert])) == [cert]
+    f = KeyFilter(fingerprints=['SHA256:' + 'A' * 43])
+    assert list(f.filter([cert])) == []
+
+
+def test_cheap_checks_first(keyfile):
+    entries = list(Key.iter_pubkey_file(keyfile, lazy=True))
+    f = KeyFilter(types=['ssh-dss'], min_length=1024)
+
+    assert _comments(f.filter(entries)) == ['sample_dsa_key@host']
+    assert [key._data is None for _, key in entries[:-1]] == [
+        True, True, True, False, True, True]
+
+    # keys and errors can be passed directly
+    keys = [key for _, key in entries]
+    assert list(f.filter(keys)) == [keys[3]]
+
+
+def test_parse_fingerprint():
+    assert parse_fingerprint('SHA256:II1fwPH9JObhdRr10NMBozqnfIVcan083hL9IR'
+                             '/O88I')[0] == 'sha256'
+    assert parse_fingerprint('MD5:c5:37') == ('md5', b'\xc5\x37')
+    with pytest.raises(ValueError):
+        parse_fingerprint('CRC32:abc')
+    with pytest.raises(ValueError):
+        parse_fingerprint('MD5:xyz')
@@ -0,0 +1,62 @@
+from sshkeys import Key, KeyParseError
+from sshkeys.scan import scan_file, split_ranges
+
+from .helpers import sample
+
+
+def _write_keys(tmpdir):
+    content = ''.join([
+        '# a comment\n',
+        sample('sample_rsa.key.pub'),
+        '\n',
+        'no-pty,command="echo \\"hi\\"" ' + sample('sample_dsa.key.pub'),
+        'ssh-rsa AAAA broken\n',
+        sample('sample_ecdsa521.key.pub').strip(),  # no trailing newline
+    ]) * 20
+    fn = tmpdir.join('keys')
+    fn.write(content)
+    return str(fn)
+
+
+def _summary(item):
+    offset, key = item
+    if isinstance(key, Key):
+        return key.type, key.data, key.comment, list(key.options.items())
+    return key.reason
+
+
+def test_scan_file(tmpdir):
+    fn = _write_keys(tmpdir)
+
+    scanned = list(scan_file(fn))
+    expected = list(Key.iter_pubkey_file(fn))
+
+    assert len(scanned) == 80
+    assert [_summary(i) for i in scanned] == [_summary(i) for i in expected]
+
+    offset, key = scanned[1]
+    assert key.options['command'] == 'echo "hi"'
+    with open(fn, 'rb') as f:
+        f.seek(offset)
+        assert f.readline().startswith(b'no-pty,')
+
+    offset, err = scanned[2]
+    assert isinstance(err, KeyParseError)
+    assert err.line == 'ssh-rsa AAAA broken'
+
+
+def test_scan_ranges(tmpdir):
+    fn = _write_keys(tmpdir)
+    full = list(scan_file(fn))
+
+    for n in (1, 2, 7, 1000):
+        chunked = []
+        for start, end in split_ranges(fn, n):
+            chunked.extend(scan_file(fn, start, end))
+        assert [o for o, _ in chunked] == [o for o, _ in full]
+
+
+def test_scan_empty_file(tmpdir):
+    fn = tmpdir.join('empty')
+    fn.write('')
+    assert list(scan_file(str(fn))) == []
@@ -1,8 +1,19 @@
 from binascii import unhexlify
 from collections import OrderedDict
+import copy
+import io
 import os
-
-from sshkeys import Key
+import pickle
+import random
+import struct
+from base64 import b64encode
+
+from sshkeys import (KEY_TYPES, CertificateKey, Ed25519Key, Key, KeyIndex,
+                     KeyParseError, RSAKey, SKEd25519Key, SKECDSAKey,
+                     disable_instrumentation, enable_instrumentation,
+                     format_fingerprint, get_instrumentation,
+                     iter_fingerprints, iter_prefixed, read_prefixed,
+                     write_pubkey_file)
 
 import pytest
 
@@ -20,6 +31,8 @@ KNOWN_KEYS = [
      'length': 4096,
      'type': 'ssh-rsa',
      'comment': 'sample_rsa_key@host',
+     'sha1_fp': 'SHA1:8vk4KdFZSPrG5AVpQ3BizHpNk0g',
+     'sha256_fp': 'SHA256:zoVoh6gre0C/0p1pGCUFiPGvcE703s4yk16zohMS6T0',
      'fingerprint': _bin_fp('b9:e2:58:1a:74:fc:62:13:52:ad:f7:28:0b:09:91:54'),
      'readable_fp': 'b9:e2:58:1a:74:fc:62:13:52:ad:f7:28:0b:09:91:54',
      },
@@ -29,6 +42,8 @@ KNOWN_KEYS = [
      'length': 2048,
      'type': 'ssh-rsa',
      'comment': 'sample_rsa2048_key@host',
+     'sha1_fp': 'SHA1:Mch1gE5Ko/vM0FGeYbs8QT8uIJA',
+     'sha256_fp': 'SHA256:/xNDbuhZV2CIKTeN25+JJrT5YlWX9qckzJrffFdn8ww',
      'fingerprint': _bin_fp('23:a7:24:ea:cc:df:f9:a8:cc:73:9b:83:71:bc:c8:56'),
      'readable_fp': '23:a7:24:ea:cc:df:f9:a8:cc:73:9b:83:71:bc:c8:56',
      },
@@ -38,6 +53,8 @@ KNOWN_KEYS = [
      'length': 1024,
      'type': 'ssh-rsa',
      'comment': 'sample_rsa1024_key@host',
+     'sha1_fp': 'SHA1:8yj3O3O/KI6iBV+XD7Wx8AqHU3s',
+     'sha256_fp': 'SHA256:J6pl3g8hyuiAp2AH+Sng+qM3x0XM2Ho/C993hIUbtL4',
      'fingerprint': _bin_fp('cf:3f:e9:18:60:cb:c3:28:b8:a1:21:34:02:19:ff:a3'),
      'readable_fp': 'cf:3f:e9:18:60:cb:c3:28:b8:a1:21:34:02:19:ff:a3',
      },
@@ -47,6 +64,8 @@ KNOWN_KEYS = [
      'length': 1234,
      'type': 'ssh-rsa',
      'comment': 'sample_rsa1234_key@host',
+     'sha1_fp': 'SHA1:+9x2ntVeiclzesXjud2X26W8XXY',
+     'sha256_fp': 'SHA256:c9u+9PstlWmXdVQwh8Kr4yJiyXOnTkjLgHfK0X5xgZk',
      'fingerprint': _bin_fp('99:53:07:1a:03:1e:52:c3:25:08:5d:7e:df:ee:86:37'),
      'readable_fp': '99:53:07:1a:03:1e:52:c3:25:08:5d:7e:df:ee:86:37',
      },
@@ -56,6 +75,8 @@ KNOWN_KEYS = [
      'length': 1024,
      'type': 'ssh-dss',
      'comment': 'sample_dsa_key@host',
+     'sha1_fp': 'SHA1:V7Vsv0qdDJ+RkzfW1b9kuIJL0rI',
+     'sha256_fp': 'SHA256:aPfSRbGGiuvnQkTMhAaB68SlwGePZGBP/4zbzU97G0k',
      'fingerprint': _bin_fp('c5:37:9e:1a:8b:1a:25:09:44:ec:8e:cb:85:ab:95:7a'),
      'readable_fp': 'c5:37:9e:1a:8b:1a:25:09:44:ec:8e:cb:85:ab:95:7a',
      },
@@ -65,6 +86,8 @@ KNOWN_KEYS = [
      'length': 256,
      'type': 'ecdsa-sha2-nistp256',
      'comment': 'sample_ecdsa256_key@host',
+     'sha1_fp': 'SHA1:ApFTImeddWAnDuhyibpmLzrltoY',
+     'sha256_fp': 'SHA256:o8FYEYE0ROG0DGcXFN644bO5R27o1EdjFiqT7g5iVK8',
      'fingerprint': _bin_fp('70:52:5e:2d:11:73:00:dc:4f:43:f7:3d:96:8e:f6:0c'),
      'readable_fp': '70:52:5e:2d:11:73:00:dc:4f:43:f7:3d:96:8e:f6:0c',
      },
@@ -73,6 +96,8 @@ KNOWN_KEYS = [
      'length': 384,
      'type': 'ecdsa-sha2-nistp384',
      'comment': 'sample_ecdsa384_key@host',
+     'sha1_fp': 'SHA1:Qnel4FhOo9rNm7TsAvI+hmt/3kM',
+     'sha256_fp': 'SHA256:kOlRE+kV16TwFljmDYqXVNuQwTTYliqUYsBIHh34vNU',
      'fingerprint': _bin_fp('bb:d0:47:64:b3:79:5b:d0:4f:7d:8c:2f:b6:33:33:3b'),
      'readable_fp': 'bb:d0:47:64:b3:79:5b:d0:4f:7d:8c:2f:b6:33:33:3b',
      },
@@ -81,9 +106,21 @@ KNOWN_KEYS = [
      'length': 521,
      'type': 'ecdsa-sha2-nistp521',
      'comment': 'sample_ecdsa521_key@host',
+     'sha1_fp': 'SHA1:NJQ+gSyVzHDpTjMT/S3JvGx5LRc',
+     'sha256_fp': 'SHA256:UFQoGj6NH/uK2f5TLOR/3+JlxIJDbg81FN5v+Kao8Z0',
      'fingerprint': _bin_fp('f1:25:0a:f6:be:f7:ec:9d:58:bd:b1:ba:5e:6d:08:df'),
      'readable_fp': 'f1:25:0a:f6:be:f7:ec:9d:58:bd:b1:ba:5e:6d:08:df',
      },
+    {'keyfile': os.path.join(base_path, 'sample_ed25519.key'),
+     'pubfile': os.path.join(base_path, 'sample_ed25519.key.pub'),
+     'length': 256,
+     'type': 'ssh-ed25519',
+     'comment': 'sample_ed25519_key@host',
+     'sha1_fp': 'SHA1:dL+FU+qTZfUNTVXHUl00oP4YtzU',
+     'sha256_fp': 'SHA256:II1fwPH9JObhdRr10NMBozqnfIVcan083hL9IR/O88I',
+     'fingerprint': _bin_fp('ae:f9:82:15:c4:b4:b3:9e:8d:33:cb:14:28:93:07:90'),
+     'readable_fp': 'ae:f9:82:15:c4:b4:b3:9e:8d:33:cb:14:28:93:07:90',
+     },
 ]
 
 
@@ -285,3 +322,575 @@ def test_broken_keys():
             k = Key.from_pubkey_line(keyline)
         print(excinfo)
 
+
+
+def test_iter_pubkey_file(tmpdir):
+    lines = []
+    for known_key in KNOWN_KEYS:
+        lines.append(open(known_key['pubfile']).read().strip())
+    lines.insert(0, '# shared keys')
+    lines.insert(3, '')
+    lines.insert(5, 'ssh-rsa AAAA broken')
+    lines.append('ssh-rsa')
+
+    fn = tmpdir.join('authorized_keys')
+    fn.write('\n'.join(lines) + '\n')
+
+    results = list(Key.iter_pubkey_file(str(fn)))
+    keys = [(lineno, k) for lineno, k in results if isinstance(k, Key)]
+    errors = [(lineno, e) for lineno, e in results if not isinstance(e, Key)]
+
+    assert [k.comment for _, k in keys] == [k['comment'] for k in KNOWN_KEYS]
+    assert [lineno for lineno, _ in keys] == [2, 3, 5, 7, 8, 9, 10, 11, 12]
+
+    assert [lineno for lineno, _ in errors] == [6, 13]
+    assert all(isinstance(e, KeyParseError) for _, e in errors)
+    assert errors[0][1].reason == 'Key contains invalid data'
+    assert errors[0][1].line == 'ssh-rsa AAAA broken'
+    assert errors[1][1].reason == 'Key has insufficient number of fields'
+    assert errors[1][1].lineno == 13
+
+    with open(str(fn)) as f:
+        assert list(Key.iter_pubkey_file(f))[0][0] == 2
+
+
+def test_iter_pubkey_file_invalid_utf8(tmpdir):
+    rsa = open(KNOWN_KEYS[0]['pubfile']).read().strip()
+    content = (rsa.encode('ascii') + b'\n' +
+               rsa.rsplit(' ', 1)[0].encode('ascii') + b' J\xf6rg@host\n'
+               b'# J\xf6rg\n' + rsa.encode('ascii') + b'\n')
+    fn = tmpdir.join('authorized_keys')
+    fn.write_binary(content)
+
+    results = list(Key.iter_pubkey_file(str(fn)))
+    assert [lineno for lineno, _ in results] == [1, 2, 4]
+    assert isinstance(results[0][1], Key)
+    assert isinstance(results[2][1], Key)
+
+    error = results[1][1]
+    assert isinstance(error, KeyParseError)
+    assert error.reason == 'Invalid UTF-8'
+    assert error.lineno == 2
+
+    # the line is written back unchanged
+    out = tmpdir.join('out')
+    write_pubkey_file(results, str(out))
+    assert out.read_binary() == content.replace(b'# J\xf6rg\n', b'')
+
+
+def test_iter_prefixed():
+    data = b'\x00\x00\x00\x03abc\x00\x00\x00\x00\x00\x00\x00\x01d'
+    assert list(iter_prefixed(data)) == [b'abc', b'', b'd']
+
+    views = list(iter_prefixed(data, copy=False))
+    assert all(isinstance(v, memoryview) for v in views)
+    assert [v.tobytes() for v in views] == [b'abc', b'', b'd']
+
+    assert read_prefixed(data) == (b'abc', 7)
+    assert read_prefixed(data, 7) == (b'', 11)
+
+
+@pytest.mark.parametrize('data', [
+    b'\x00\x00\x00',
+    b'\x00\x00\x00\x05abc',
+    b'\x00\x00\x00\x01a\x00\x00',
+])
+def test_iter_prefixed_truncated(data):
+    with pytest.raises(ValueError):
+        list(iter_prefixed(data))
+
+
+def test_lazy_loading(known_key):
+    line = open(known_key['pubfile']).read().strip()
+    k = Key.from_pubkey_line(line, lazy=True)
+
+    assert k.type == known_key['type']
+    assert k.comment == known_key['comment']
+    assert k.to_pubkey_line() == line
+    assert k._data is None
+
+    assert k.length == known_key['length']
+    assert k.fingerprint == known_key['fingerprint']
+    assert k.data == Key.from_pubkey_line(line).data
+
+
+def test_lazy_loading_invalid_data():
+    k = Key.from_pubkey_line('ssh-rsa AAAAB3NzaC1yc2EAAA*invalid', lazy=True)
+    assert k.type == 'ssh-rsa'
+
+    with pytest.raises(KeyParseError):
+        k.data
+
+    with pytest.raises(KeyParseError):
+        Key.from_pubkey_line('ssh-rsa AAAAB3Nza', lazy=True)
+
+
+def _legacy_extract_options(line):
+    # the original, per-character implementation of Key._extract_options,
+    # used as a reference for the tokenizer
+    options = OrderedDict({})
+    quoted = False
+    escaped = False
+    option_name = ''
+    option_val = None
+    key_without_options = ''
+    in_options = True
+    in_option_name = True
+    for letter in line.strip():
+        if in_options:
+            if quoted:
+                if letter == "\\":
+                    escaped = True
+                elif letter == '"':
+                    if escaped:
+                        option_val += letter
+                        escaped = False
+                    else:
+                        quoted = False
+                else:
+                    if escaped:
+                        option_val += "\\"
+                        escaped = False
+                    option_val += letter
+            else:
+                if letter == ' ':
+                    in_options = False
+                    # originally a fixed list of types; now the registry
+                    if option_name in KEY_TYPES:
+                        key_without_options = option_name + " "
+                        option_name = ''
+                    else:
+                        if option_val is None:
+                            options[option_name] = True
+                        else:
+                            options[option_name] = option_val
+                elif letter == '"':
+                    quoted = True
+                elif letter == '=':
+                    in_option_name = False
+                    if option_val is None:
+                        option_val = ''
+                elif letter == ',':
+                    if option_val is None:
+                        options[option_name] = True
+                    else:
+                        options[option_name] = option_val
+                    in_option_name = True
+                    option_name = ''
+                    option_val = None
+                else:
+                    if in_option_name:
+                        option_name += letter
+                    else:
+                        option_val += letter
+        else:
+            key_without_options += letter
+    if key_without_options == '':
+        return OrderedDict({}), line.strip()
+    else:
+        return options, key_without_options
+
+
+def test_extract_options_differential():
+    tokens = ['no-pty', 'command', 'from', 'ssh-rsa', 'ssh-dss',
+              'ecdsa-sha2-nistp256', 'ssh-ed25519', 'AAAAB3Nza', '=', '=', ',', ',', '"',
+              '"', '\\', '\\', ' ', ' ', '\t', 'a', 'x y', '*.example.com']
+    rnd = random.Random(0x55484b)
+
+    for _ in range(20000):
+        line = ''.join(rnd.choice(tokens)
+                       for _ in range(rnd.randint(0, 12)))
+        try:
+            expected = _legacy_extract_options(line)
+        except TypeError:
+            # the legacy implementation crashed on some malformed options,
+            # these are reported as parse errors now
+            with pytest.raises(KeyParseError):
+                Key._extract_options(line)
+        else:
+            assert Key._extract_options(line) == expected, line
+
+
+def test_key_equality():
+    line = open(KNOWN_KEYS[0]['pubfile']).read()
+    a = Key.from_pubkey_line(line)
+    b = Key.from_pubkey_line(line, lazy=True)
+    b.comment = 'other'
+    c = Key.from_pubkey_file(KNOWN_KEYS[1]['pubfile'])
+
+    assert a == b
+    assert not a != b
+    assert hash(a) == hash(b)
+    assert a != c
+    assert a != line
+    assert len(set([a, b, c])) == 2
+
+
+def test_key_index(tmpdir):
+    fn = tmpdir.join('authorized_keys')
+    fn.write(''.join(open(k['pubfile']).read() for k in KNOWN_KEYS) +
+             'ssh-rsa\n' + open(KNOWN_KEYS[0]['pubfile']).read())
+
+    index = KeyIndex()
+    errors = index.add_file(str(fn))
+
+    assert len(errors) == 1
+    assert len(index) == len(KNOWN_KEYS)
+
+    rsa = Key.from_pubkey_file(KNOWN_KEYS[0]['pubfile'])
+    assert rsa in index
+    assert index.get(rsa).comment == KNOWN_KEYS[0]['comment']
+    assert index.locations(rsa) == [(str(fn), 1),
+                                    (str(fn), len(KNOWN_KEYS) + 2)]
+
+    assert len(index.by_type('ssh-rsa')) == 4
+    assert len(index.by_type('ecdsa-sha2-nistp256')) == 1
+    assert index.by_comment('sample_dsa_key@host')[0].type == 'ssh-dss'
+
+    other = KeyIndex([rsa])
+    assert len(other) == 1
+    assert other.locations(rsa) == []
+    assert Key.from_pubkey_file(KNOWN_KEYS[1]['pubfile']) not in other
+
+
+def test_fingerprint_algorithms(known_key):
+    k = Key.from_pubkey_file(known_key['pubfile'])
+
+    assert k.get_fingerprint() == known_key['fingerprint']
+    assert k.get_readable_fingerprint('sha256') == known_key['sha256_fp']
+    assert k.get_readable_fingerprint('sha1') == known_key['sha1_fp']
+    assert (k.get_readable_fingerprint('md5') ==
+            'MD5:' + known_key['readable_fp'])
+
+    # cached per algorithm, reset when data changes
+    assert k.get_fingerprint('sha256') is k.get_fingerprint('sha256')
+    k.data = b'\x00\x00\x00\x07ssh-rsa'
+    assert k.get_readable_fingerprint('sha256') != known_key['sha256_fp']
+
+    with pytest.raises(ValueError):
+        k.get_fingerprint('crc32')
+
+
+def test_iter_fingerprints():
+    keys = [Key.from_pubkey_file(k['pubfile']) for k in KNOWN_KEYS]
+    keys[0].get_fingerprint('sha256')
+    items = keys + [keys[1].data]
+
+    fps = list(iter_fingerprints(items, 'sha256'))
+    assert [format_fingerprint(fp, 'sha256') for fp in fps] == (
+        [k['sha256_fp'] for k in KNOWN_KEYS] + [KNOWN_KEYS[1]['sha256_fp']])
+    assert keys[2]._fingerprints['sha256'] is fps[2]
+
+    assert (list(iter_fingerprints(keys)) ==
+            [k['fingerprint'] for k in KNOWN_KEYS])
+
+
+def test_compact_representation(known_key):
+    k = Key.from_pubkey_file(known_key['pubfile'])
+    assert not hasattr(k, '__dict__')
+
+    # keys without options share an immutable placeholder, until the
+    # options are requested
+    other = Key.from_pubkey_file(known_key['pubfile'])
+    assert k._options is other._options
+    with pytest.raises(TypeError):
+        k._options['no-pty'] = True
+
+    k.options['no-pty'] = True
+    assert k.to_pubkey_line().startswith('no-pty ')
+    assert not other._options
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_pickle(known_key, lazy):
+    line = open(known_key['pubfile']).read().strip()
+    for k in (Key.from_pubkey_line(line, lazy),
+              Key.from_pubkey_line('no-pty ' + line, lazy)):
+        for other in (pickle.loads(pickle.dumps(k)), copy.deepcopy(k)):
+            assert type(other) is type(k)
+            assert other == k
+            assert other.to_pubkey_line() == k.to_pubkey_line()
+            assert other.options == k.options
+
+    # the placeholder for empty options stays shared
+    k = pickle.loads(pickle.dumps(Key.from_pubkey_line(line, lazy)))
+    assert k._options is Key.from_pubkey_line(line)._options
+
+
+def test_pickle_certificate():
+    # the certified key is cached without options
+    cert = Key.from_pubkey_file(
+        os.path.join(base_path, 'sample_ed25519.key-cert.pub'))
+    public_key = cert.public_key
+    assert pickle.loads(pickle.dumps(cert)).public_key == public_key
+
+
+def test_instrumentation():
+    lines = [open(k['pubfile']).read() for k in KNOWN_KEYS]
+    broken = ['', 'ssh-rsa', 'ssh-rsa AAAA', 'ssh-rsa AAAAB3Nza',
+              'ssh-rsa AAAAB3NzaC1mb28=']
+
+    laps = []
+    ins = enable_instrumentation(lambda stage, t: laps.append(stage))
+    try:
+        assert get_instrumentation() is ins
+        for line in lines:
+            Key.from_pubkey_line(line).fingerprint
+        Key.from_pubkey_line(lines[0], lazy=True).data
+        for line in broken:
+            with pytest.raises(KeyParseError):
+                Key.from_pubkey_line(line)
+
+        snap = ins.snapshot(reset=True)
+    finally:
+        assert disable_instrumentation() is ins
+
+    n = len(KNOWN_KEYS)
+    assert snap['calls'] == {'options': n + 4, 'decode': n + 3,
+                             'dispatch': n + 1, 'fingerprint': n}
+    assert snap['errors'] == {
+        'Empty key': 1,
+        'Key has insufficient number of fields': 1,
+        'Key contains invalid data': 2,
+        'Unknown key type': 1,
+    }
+    assert all(t >= 0 for t in snap['seconds'].values())
+    assert len(laps) == sum(snap['calls'].values())
+
+    assert ins.errors == {}
+    assert ins.calls['options'] == 0
+
+    Key.from_pubkey_line(lines[0])
+    assert get_instrumentation() is None
+    assert ins.calls['options'] == 0
+
+
+def _pack(*fields):
+    return b''.join(struct.pack('!I', len(f)) + f for f in fields)
+
+
+def test_security_keys():
+    pk = bytes(bytearray(range(32)))
+    blob = _pack(b'sk-ssh-ed25519@openssh.com', pk, b'ssh:')
+    k = Key.from_pubkey_line('sk-ssh-ed25519@openssh.com %s user@host'
+                             % b64encode(blob).decode('ascii'))
+    assert isinstance(k, SKEd25519Key)
+    assert k.type == 'sk-ssh-ed25519@openssh.com'
+    assert k.length == 256
+
+    blob = _pack(b'sk-ecdsa-sha2-nistp256@openssh.com', b'nistp256',
+                 b'\x04' + pk + pk, b'ssh:')
+    k = Key.from_pubkey_line('no-pty sk-ecdsa-sha2-nistp256@openssh.com %s'
+                             % b64encode(blob).decode('ascii'))
+    assert isinstance(k, SKECDSAKey)
+    assert k.options == OrderedDict([('no-pty', True)])
+    assert k.length == 256
+
+
+def test_certificates():
+    ca = Key.from_pubkey_file(os.path.join(base_path, 'sample_ca.key.pub'))
+    rsa = Key.from_pubkey_file(KNOWN_KEYS[1]['pubfile'])
+
+    line = open(os.path.join(base_path, 'sample_rsa2048.key-cert.pub')).read()
+    cert = Key.from_pubkey_line('cert-authority ' + line)
+    assert isinstance(cert, CertificateKey)
+    assert cert.type == 'ssh-rsa-cert-v01@openssh.com'
+    assert cert.options == OrderedDict([('cert-authority', True)])
+    assert cert.comment == 'sample_rsa2048_key@host'
+    assert cert._components is None
+
+    assert cert.public_key_type == 'ssh-rsa'
+    assert isinstance(cert.public_key, RSAKey)
+    assert cert.public_key == rsa
+    assert cert.fingerprint_key is cert.public_key
+    assert rsa.fingerprint_key is rsa
+    assert cert.length == 2048
+    assert cert.serial == 42
+    assert cert.cert_type == CertificateKey.USER_CERT
+    assert cert.key_id == 'sample_cert'
+    assert cert.principals == ['alice', 'bob']
+    assert cert.valid_after == 1577836800
+    assert cert.valid_before == 1893456000
+    assert cert.critical_options == OrderedDict([
+        ('force-command', '/bin/true')])
+    assert list(cert.extensions) == [
+        'permit-X11-forwarding', 'permit-agent-forwarding',
+        'permit-port-forwarding', 'permit-pty', 'permit-user-rc']
+    assert cert.signature_key == ca.data
+    assert len(cert.nonce) == 32
+
+    line = open(os.path.join(base_path, 'sample_ed25519.key-cert.pub')).read()
+    cert = Key.from_pubkey_line(line)
+    assert isinstance(cert.public_key, Ed25519Key)
+    assert cert.length == 256
+    assert cert.cert_type == CertificateKey.HOST_CERT
+    assert cert.principals == ['host.example.com']
+    assert cert.valid_before == 2 ** 64 - 1
+
+
+def test_key_type_registry():
+    assert KEY_TYPES['ssh-ed25519'] is KEY_TYPES[b'ssh-ed25519']
+    assert 'ssh-ed25519' not in Key._extract_options(
+        'ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIHXUuobA')[0]
+
+    with pytest.raises(KeyParseError) as excinfo:
+        Key.from_pubkey_line('ssh-rsa ' + b64encode(
+            _pack(b'ecdsa-sha2-nistp999')).decode('ascii'))
+    assert excinfo.value.reason == 'Unknown key type'
+
+
+def test_key_components():
+    rsa = Key.from_pubkey_file(KNOWN_KEYS[3]['pubfile'])
+    assert rsa.e == 65537
+    assert rsa.n.bit_length() == 1234
+    assert rsa._components['n'] is rsa.n
+
+    dsa = Key.from_pubkey_file(KNOWN_KEYS[4]['pubfile'])
+    assert dsa.p.bit_length() == 1024
+    assert dsa.q.bit_length() == 160
+    assert 1 < dsa.g < dsa.p
+    assert 1 < dsa.y < dsa.p
+
+    ecdsa = Key.from_pubkey_file(KNOWN_KEYS[5]['pubfile'])
+    assert ecdsa.curve == 'nistp256'
+    assert len(ecdsa.point) == 65
+    assert ecdsa.point[:1] == b'\x04'
+
+    ed25519 = Key.from_pubkey_file(KNOWN_KEYS[8]['pubfile'])
+    assert len(ed25519.pk) == 32
+
+    # replacing the data invalidates cached components
+    rsa.data = Key.from_pubkey_file(KNOWN_KEYS[2]['pubfile']).data
+    assert rsa._components is None
+    assert rsa.length == 1024
+
+    rsa.data = _pack(b'ssh-rsa', b'\x01\x00\x01')
+    with pytest.raises(ValueError):
+        rsa.n
+
+
+ROUND_TRIP_LINES = [
+    'no-pty,command="echo \\"hi\\""  ' +
+    open(KNOWN_KEYS[0]['pubfile']).read().strip(),
+    open(KNOWN_KEYS[4]['pubfile']).read().strip().replace(' ', '   ', 1),
+    open(KNOWN_KEYS[5]['pubfile']).read().strip() + '  two  spaces',
+]
+
+
+def test_unmodified_keys_keep_formatting():
+    for line in ROUND_TRIP_LINES:
+        assert Key.from_pubkey_line(line + '\n').to_pubkey_line() == line
+        assert Key.from_pubkey_line(line, lazy=True).to_pubkey_line() == line
+
+    k = Key.from_pubkey_line(ROUND_TRIP_LINES[0])
+    k.options['no-pty'] = True
+    assert k.to_pubkey_line().startswith('no-pty,command="echo \\"hi\\"" ')
+
+    k = Key.from_pubkey_line(ROUND_TRIP_LINES[1])
+    k.comment = 'changed'
+    assert k.to_pubkey_line().startswith('ssh-dss AAAAB3NzaC1kc3MAAACBA')
+    assert k.to_pubkey_line().endswith(' changed')
+
+
+def test_reading_options_keeps_formatting():
+    line = 'tunnel=5,no-pty ' + open(KNOWN_KEYS[5]['pubfile']).read().strip()
+    for lazy in (False, True):
+        k = Key.from_pubkey_line(line, lazy)
+        assert 'no-pty' in k.options
+        assert k.options['tunnel'] == '5'
+        assert k.to_pubkey_line() == line
+
+        # in-place changes are still written
+        k.options['tunnel'] = '6'
+        assert k.to_pubkey_line().startswith('tunnel="6",no-pty ')
+        del k.options['tunnel']
+        assert k.to_pubkey_line().startswith('no-pty ')
+
+    k = Key.from_pubkey_line(ROUND_TRIP_LINES[1])
+    assert not k.options
+    assert k.to_pubkey_line() == ROUND_TRIP_LINES[1]
+    k.options['no-pty'] = True
+    assert k.to_pubkey_line().startswith('no-pty ssh-dss ')
+
+
+def test_write_pubkey_file(tmpdir):
+    fn = tmpdir.join('authorized_keys')
+    content = '\n'.join(['# header'] + ROUND_TRIP_LINES + ['ssh-rsa']) + '\n'
+    fn.write(content)
+
+    entries = list(Key.iter_pubkey_file(str(fn)))
+    out = tmpdir.join('out')
+    assert write_pubkey_file(['# header'] + entries, str(out)) == 5
+    assert out.read() == content
+
+    entries[2][1].comment = 'changed'
+    buf = io.StringIO()
+    write_pubkey_file(entries, buf)
+    lines = buf.getvalue().splitlines()
+    assert lines[0] == ROUND_TRIP_LINES[0]
+    assert lines[2].endswith(' changed')
+
+
+def test_write_pubkey_file_atomic(tmpdir):
+    fn = tmpdir.join('authorized_keys')
+    fn.write('old\n')
+    fn.chmod(0o600)
+
+    keys = [Key.from_pubkey_file(k['pubfile']) for k in KNOWN_KEYS]
+    write_pubkey_file(keys, str(fn), atomic=True)
+    assert fn.read() == ''.join(open(k['pubfile']).read().strip() + '\n'
+                                for k in KNOWN_KEYS)
+    assert fn.stat().mode & 0o777 == 0o600
+    assert tmpdir.listdir() == [fn]
+
+    def failing():
+        yield keys[0]
+        raise RuntimeError('connection lost')
+
+    with pytest.raises(RuntimeError):
+        write_pubkey_file(failing(), str(fn), atomic=True)
+    assert fn.read().startswith(keys[0].to_pubkey_line() + '\n' +
+                                keys[1].to_pubkey_line())
+    assert tmpdir.listdir() == [fn]
+
+
+@pytest.mark.skipif(not hasattr(os, 'symlink'), reason='needs symlinks')
+def test_write_pubkey_file_atomic_symlink(tmpdir):
+    real = tmpdir.mkdir('real').join('authorized_keys')
+    real.write('old\n')
+    link = tmpdir.join('authorized_keys')
+    link.mksymlinkto(real)
+
+    write_pubkey_file(['new'], str(link), atomic=True)
+    assert link.islink()
+    assert real.read() == 'new\n'
+    assert sorted(tmpdir.listdir()) == [link, real.dirpath()]
+    assert real.dirpath().listdir() == [real]
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self/fd'),
+                    reason='needs /proc/self/fd')
+def test_write_pubkey_file_atomic_closes_fd(tmpdir, monkeypatch):
+    fn = tmpdir.join('authorized_keys')
+    fn.write('old\n')
+
+    def chmod(*args):
+        raise PermissionError('denied')
+    monkeypatch.setattr(os, 'chmod', chmod)
+    open_fds = len(os.listdir('/proc/self/fd'))
+    with pytest.raises(PermissionError):
+        write_pubkey_file(['new'], str(fn), atomic=True)
+    assert len(os.listdir('/proc/self/fd')) == open_fds
+    assert tmpdir.listdir() == [fn]
+
+
+@pytest.mark.skipif(not hasattr(os, 'geteuid') or os.geteuid() != 0,
+                    reason='changing file owners requires root')
+def test_write_pubkey_file_atomic_owner(tmpdir):
+    fn = tmpdir.join('authorized_keys')
+    fn.write('old\n')
+    os.chown(str(fn), 4321, 4322)
+
+    write_pubkey_file(['new'], str(fn), atomic=True)
+    assert fn.read() == 'new\n'
+    assert (fn.stat().uid, fn.stat().gid) == (4321, 4322)